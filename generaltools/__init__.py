@@ -1,3 +1,5 @@
-from .blaster_date_tools import daterange
+from .blaster_date_tools import daterange, daterange_batches, daterange_chunks, parse_date
 from .blaster_logger import logger, log_this
-from .blaster_open_yml_json import MyNamespace, open_yml, open_json
+from .blaster_timing import timing_registry
+from .blaster_open_yml_json import MyNamespace, open_yml, open_json, config_cache
+from .blaster_stream_yml_json import load_json_key, iter_json, load_yml_key, iter_yml
@@ -1,4 +1,4 @@
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
 try:
     # pip install python-dateutil
@@ -6,11 +6,24 @@ try:
 except ModuleNotFoundError:
     pass
 
+try:
+    # pip install numpy
+    import numpy as np
+except ModuleNotFoundError:
+    pass
 
-def daterange(start_date, end_date):
+try:
+    # pip install pandas
+    import pandas as pd
+except ModuleNotFoundError:
+    pass
+
+
+def daterange(start_date, end_date, step=1):
     """
     Accepts either datetime objects or str in format YYYY-MM-DD for start_date and end_date.
-    Works similar to built-in range(). Source: https://stackoverflow.com/a/1060330/9268478
+    Works similar to built-in range(), yields only whole steps between start_date and end_date.
+    Source: https://stackoverflow.com/a/1060330/9268478
 
     Usage:
 
@@ -21,13 +34,112 @@ def daterange(start_date, end_date):
     2018-12-03 00:00:00
     2018-12-04 00:00:00
 
+    >>> list(daterange('2018-12-01T00:00', '2018-12-01T03:00', step=timedelta(hours=1)))
+
     :param start_date:
     :param end_date:
+    :param step: timedelta or number of days
+    :return: generator
+    """
+    start_date, end_date, step = _parse_range(start_date, end_date, step)
+    for n in range(_count_steps(start_date, end_date, step)):
+        yield start_date + step * n
+
+
+def daterange_batches(start_date, end_date, step=1, batch_size=10000, as_pandas=False):
+    """
+    Same dates as daterange, yielded in blocks of up to batch_size items computed at once by numpy.
+
+    Yields numpy datetime64[us] arrays, or pandas DatetimeIndex if as_pandas is True. Like daterange, dates are
+    stepped in local wall time, so across a DST change a daily step keeps the time of day. numpy has no timezones,
+    so timezone-aware dates are yielded as naive UTC arrays, while DatetimeIndex keeps the timezone of start_date.
+    Timezone-aware dates need pandas, also for numpy arrays.
+
+    :param start_date: datetime or ISO-8601 str
+    :param end_date: datetime or ISO-8601 str
+    :param step: timedelta or number of days
+    :param batch_size: max number of dates in one block
+    :param as_pandas: True to yield pandas.DatetimeIndex instead of numpy arrays
+    :return: generator
+    """
+    start_date, end_date, step = _parse_range(start_date, end_date, step)
+    count = _count_steps(start_date, end_date, step)
+    tz = start_date.tzinfo
+    # Wall time arithmetic, same as start_date + step * n of aware datetimes
+    start = np.datetime64(start_date.replace(tzinfo=None), "us")
+    step = np.timedelta64(step, "us")
+    for offset in range(0, count, batch_size):
+        block = start + step * np.arange(offset, min(offset + batch_size, count))
+        if tz is None:
+            yield pd.DatetimeIndex(block) if as_pandas else block
+            continue
+        # Same UTC offsets as datetime: ambiguous times take the first (DST) offset, times in a DST gap the offset
+        # before it, i.e. they are shifted forward by the gap (assumed to be one hour)
+        index = pd.DatetimeIndex(block).tz_localize(
+            tz, ambiguous=np.ones(len(block), dtype=bool), nonexistent=pd.Timedelta(hours=1)
+        )
+        yield index if as_pandas else index.tz_convert("UTC").tz_localize(None).to_numpy()
+
+
+def daterange_chunks(start_date, end_date, window, step=None):
+    """
+    Yields (window_start, window_end) tuples covering start_date to end_date. The last window is cut at end_date,
+    windows may overlap if step is shorter than window.
+
+    Usage:
+
+    >>> for start, end in daterange_chunks('2018-12-01', '2018-12-10', window=7):
+    >>>     print(start, end)
+    2018-12-01 00:00:00 2018-12-08 00:00:00
+    2018-12-08 00:00:00 2018-12-10 00:00:00
+
+    :param start_date: datetime or ISO-8601 str
+    :param end_date: datetime or ISO-8601 str
+    :param window: timedelta or number of days, length of a window
+    :param step: timedelta or number of days between window starts, same as window by default
     :return: generator
     """
-    if not isinstance(start_date, datetime):
-        start_date = parser.parse(start_date)
-    if not isinstance(end_date, datetime):
-        end_date = parser.parse(end_date)
-    for n in range(int((end_date - start_date).days)):
-        yield start_date + timedelta(n)
+    window = _to_timedelta(window)
+    start_date, end_date, step = _parse_range(start_date, end_date, step if step is not None else window)
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + window, end_date)
+        yield window_start, window_end
+        if window_end == end_date:
+            return
+        window_start += step
+
+
+def parse_date(value):
+    """
+    Converts str to datetime. ISO-8601 strings take the fast datetime.fromisoformat path, everything else is
+    parsed by dateutil. datetime objects are returned as is, date objects are converted to datetime.
+
+    :param value: str, date or datetime
+    :return: datetime
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def _to_timedelta(step):
+    if isinstance(step, timedelta):
+        return step
+    return timedelta(days=step)
+
+
+def _parse_range(start_date, end_date, step):
+    step = _to_timedelta(step)
+    if step <= timedelta(0):
+        raise ValueError(f"step must be positive, not {step}")
+    return parse_date(start_date), parse_date(end_date), step
+
+
+def _count_steps(start_date, end_date, step):
+    return max((end_date - start_date) // step, 0)
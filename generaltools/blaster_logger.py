@@ -1,13 +1,99 @@
+import atexit
+import inspect
 import logging
 import os
+import queue
+import random
 import time
 from functools import wraps
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 
 from definitions import LOG_DIR  # Required for logger to work
+from .blaster_timing import timing_registry
 
 
-def make_logger(log_dir):
+OVERFLOW_DROP_DEBUG = "drop_debug"
+OVERFLOW_BLOCK = "block"
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler with a bounded queue and an explicit overflow policy.
+
+    With OVERFLOW_DROP_DEBUG (default) records of level DEBUG and below are dropped when the queue is full, while
+    everything above DEBUG blocks until the listener frees a slot, so warnings and errors are never lost.
+    With OVERFLOW_BLOCK every record blocks. Number of dropped records is kept in self.dropped.
+    Once the listener is stopped (self.stopped) nothing blocks anymore, records which don't fit are dropped.
+    """
+
+    def __init__(self, queue_, overflow=OVERFLOW_DROP_DEBUG):
+        if overflow not in (OVERFLOW_DROP_DEBUG, OVERFLOW_BLOCK):
+            raise ValueError(f"overflow must be {OVERFLOW_DROP_DEBUG!r} or {OVERFLOW_BLOCK!r}, not {overflow!r}")
+        super().__init__(queue_)
+        self.overflow = overflow
+        self.dropped = 0
+        self.stopped = False
+
+    def enqueue(self, record):
+        if not self.stopped and (self.overflow == OVERFLOW_BLOCK or record.levelno > logging.DEBUG):
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BlockingSentinelQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # QueueListener uses put_nowait, which raises queue.Full when the queue is full at stop
+        self.queue.put(self._sentinel)
+
+
+_queue_listener = None
+_queue_handler = None
+
+
+def stop_queue_listener():
+    """
+    Stops background listener started by make_logger(async_mode=True), writing out all queued records first.
+    Registered with atexit, safe to call more than once.
+    """
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_handler.stopped = True
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+def _remove_queue_handler():
+    """
+    Stops the listener and takes its queue handler off the root logger, so make_logger can configure it again.
+    """
+    global _queue_handler
+    stop_queue_listener()
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def make_logger(log_dir, async_mode=False, queue_size=10000, overflow=OVERFLOW_DROP_DEBUG):
+    """
+    Configures root logging with console, full.log, main.log and errors.log handlers and returns "MAIN" logger.
+
+    If async_mode is True callers only put records into a bounded queue and a background QueueListener thread owns
+    all handlers, so file writes and rotation never happen on the calling thread. Queue is drained at exit.
+
+    :param log_dir: directory for log files
+    :param async_mode: True to log through a queue and a background listener thread
+    :param queue_size: max number of records waiting in the queue (async_mode only)
+    :param overflow: OVERFLOW_DROP_DEBUG or OVERFLOW_BLOCK, what to do when the queue is full (async_mode only)
+    :return: logging.Logger
+    """
+    global _queue_listener, _queue_handler
+    # basicConfig below doesn't touch a root logger which already has handlers, a queue handler left there by
+    # a previous async make_logger would never be drained again
+    _remove_queue_handler()
     full_logfile = os.path.join(log_dir, "full.log")
     logfile = os.path.join(log_dir, "main.log")
     file_formatter = logging.Formatter(
@@ -53,34 +139,156 @@ def make_logger(log_dir):
     fh2.setFormatter(file_formatter)
     error_log.setFormatter(file_formatter)
 
-    logging.basicConfig(level=logging.DEBUG, handlers=[fh, ch, fh2, error_log])
+    handlers = [fh, ch, fh2, error_log]
+    if async_mode:
+        _queue_handler = BoundedQueueHandler(queue.Queue(maxsize=queue_size), overflow=overflow)
+        _queue_handler.setFormatter(logging.Formatter("%(message)s"))
+        _queue_listener = _BlockingSentinelQueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _queue_listener.start()
+        handlers = [_queue_handler]
+
+    logging.basicConfig(level=logging.DEBUG, handlers=handlers)
 
     return logging.getLogger("MAIN")
 
 
-logger = make_logger(LOG_DIR)
+atexit.register(stop_queue_listener)
+
+logger = make_logger(LOG_DIR, async_mode=bool(os.environ.get('LOG_ASYNC')))
 if os.environ.get('DEBUG'):
     logger.warning('DEBUG MODE ON. ALL MESSAGES WILL BE PRINTED TO CONSOLE.')
 
 
-def log_this(func):
-    @wraps(func)
-    def decorator(*args, **kwargs):
-        logger.debug(f"Enter: {func.__name__} [{func.__module__}]")
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = round(end_time - start_time, 4)
-        if isinstance(result, str):
-            log_result = result.split("\n")[0]
-        else:
-            log_result = result
-
-        if execution_time >= 10:
-            logger.warning(f"Long execution time: {execution_time} [{func.__module__}.{func.__name__}]")
-
-        logger.debug(f"Execution time: {execution_time}s. Result: {func.__name__}: {log_result} [{func.__module__}]")
-        logger.debug(f"Exit: {func.__name__} [{func.__module__}]")
-        return result
+def _trace_enter(func):
+    logger.debug("Enter: %s [%s]", func.__name__, func.__module__)
+
+
+def _trace_exit(func, elapsed, result, traced, slow_threshold):
+    if slow_threshold is not None and elapsed >= slow_threshold:
+        logger.warning("Long execution time: %s [%s.%s]", round(elapsed, 4), func.__module__, func.__name__)
+    if not traced:
+        return
+    if isinstance(result, str):
+        result = result.split("\n", 1)[0]
+    logger.debug(
+        "Execution time: %ss. Result: %s: %s [%s]", round(elapsed, 4), func.__name__, result, func.__module__
+    )
+    logger.debug("Exit: %s [%s]", func.__name__, func.__module__)
+
+
+def log_this(func=None, slow_threshold=10, sample_rate=1.0):
+    """
+    Logs enter, exit, result and execution time of decorated function and records its timing into
+    blaster_timing.timing_registry. Can be used both as @log_this and @log_this(slow_threshold=2).
+
+    Nothing is formatted unless DEBUG is enabled for the logger. With sample_rate < 1 only that share of calls
+    is traced to the debug log, timings and slow call warnings are still recorded for every call.
+    Coroutine functions, generators and async generators are timed until their real completion (last item
+    yielded, generator closed or coroutine returned), not until the coroutine/generator object is created.
+
+    :param func: decorated function
+    :param slow_threshold: execution time in seconds from which a warning is logged, None to disable
+    :param sample_rate: share of calls traced to debug log, between 0 and 1
+    :return:
+    """
+    if func is None:
+        return lambda f: log_this(f, slow_threshold=slow_threshold, sample_rate=sample_rate)
+
+    timings = timing_registry.get(f"{func.__module__}.{func.__qualname__}")
+
+    def should_trace():
+        if not logger.isEnabledFor(logging.DEBUG):
+            return False
+        return sample_rate >= 1 or random.random() < sample_rate
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def decorator(*args, **kwargs):
+            traced = should_trace()
+            if traced:
+                _trace_enter(func)
+            start_time = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                timings.record(time.perf_counter() - start_time, error=True)
+                raise
+            elapsed = time.perf_counter() - start_time
+            timings.record(elapsed)
+            _trace_exit(func, elapsed, result, traced, slow_threshold)
+            return result
+
+    elif inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def decorator(*args, **kwargs):
+            traced = should_trace()
+            if traced:
+                _trace_enter(func)
+            start_time = time.perf_counter()
+            error = False
+            generator = func(*args, **kwargs)
+            try:
+                # Driven by hand to pass asend() values and athrow() exceptions through, like yield from does
+                item = await generator.__anext__()
+                while True:
+                    try:
+                        sent = yield item
+                    except GeneratorExit:
+                        await generator.aclose()
+                        raise
+                    except BaseException as e:
+                        item = await generator.athrow(e)
+                    else:
+                        item = await generator.asend(sent)
+            except StopAsyncIteration:
+                pass
+            except Exception:
+                error = True
+                raise
+            finally:
+                # Also when closed early (break out of async for)
+                elapsed = time.perf_counter() - start_time
+                timings.record(elapsed, error=error)
+                if not error:
+                    _trace_exit(func, elapsed, None, traced, slow_threshold)
+
+    elif inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def decorator(*args, **kwargs):
+            traced = should_trace()
+            if traced:
+                _trace_enter(func)
+            start_time = time.perf_counter()
+            error = False
+            result = None
+            try:
+                result = yield from func(*args, **kwargs)
+                return result
+            except Exception:
+                error = True
+                raise
+            finally:
+                # Also when closed early (break out of for)
+                elapsed = time.perf_counter() - start_time
+                timings.record(elapsed, error=error)
+                if not error:
+                    _trace_exit(func, elapsed, result, traced, slow_threshold)
+
+    else:
+        @wraps(func)
+        def decorator(*args, **kwargs):
+            traced = should_trace()
+            if traced:
+                _trace_enter(func)
+            start_time = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                timings.record(time.perf_counter() - start_time, error=True)
+                raise
+            elapsed = time.perf_counter() - start_time
+            timings.record(elapsed)
+            _trace_exit(func, elapsed, result, traced, slow_threshold)
+            return result
 
     return decorator
@@ -1,94 +1,342 @@
 from collections import abc, UserDict
-from functools import lru_cache
+from functools import wraps
 from keyword import iskeyword
 
+import hashlib
 import json
+import logging
+import os
+import pickle
+import re
+import threading
+import time
 
 try:
     # pip install PyYAML
     import yaml
+
+    # libyaml bindings are several times faster than the pure python loader
+    YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 except ModuleNotFoundError:
     pass
 
+try:
+    # pip install orjson
+    import orjson
+
+    # 20+ digits in a row: maybe an integer over 64 bits, which newer orjson versions reject and older ones
+    # (e.g. 3.8) return as float, losing precision. Such documents are parsed by json, false positives (long
+    # fractions, digits in strings) are only slower.
+    _LONG_NUMBER = re.compile(rb"\d{20}")
+
+    def _json_loads(data):
+        if isinstance(data, str):
+            data = data.encode()
+        if _LONG_NUMBER.search(data):
+            return json.loads(data)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity, which json accepts
+            return json.loads(data)
+except ModuleNotFoundError:
+    _json_loads = json.loads
+
+# Parsed files are stored in ".<filename>.snapshot" next to the source, keyed by hash of source content.
+# Snapshots are pickles, only enable this for config directories nobody else can write to.
+SNAPSHOTS_ENABLED = bool(os.environ.get("CONFIG_SNAPSHOTS"))
+
+
+class FileCache:
+    """
+    Cache of parsed files which revalidates entries by file mtime and size. The file is stat'ed at most once per
+    check_interval seconds, if it changed all cached results for it are dropped and reload callbacks are called.
+
+    Usage:
+
+    >>> config_cache.check_interval = 10
+    >>> config_cache.on_reload('config.yml', lambda filename: print(f'{filename} changed'))
+    >>> config_cache.watch()  # optional, checks files in background instead of on access
+    >>> config_cache.invalidate('config.yml')
+
+    :param check_interval: min number of seconds between two stat calls for the same file
+    """
+
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        self._entries = {}
+        self._signatures = {}
+        self._callbacks = {}
+        self._lock = threading.RLock()
+        self._watcher = None
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def cached(self, loader):
+        """
+        Decorator for loader(filename, as_dict=False, top_key=None).
+        """
+        @wraps(loader)
+        def wrapper(filename, as_dict=False, top_key=None):
+            path = os.path.abspath(filename)
+            key = (loader.__name__, path, as_dict, top_key)
+            self._revalidate(path)
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key]
+            # Taken before loading, so a change during loading is picked up on the next check
+            signature = self._signature(path)
+            value = loader(filename, as_dict, top_key)
+            with self._lock:
+                self._entries[key] = value
+                self._signatures.setdefault(path, [signature, time.monotonic()])
+            return value
+
+        wrapper.cache_clear = self.invalidate
+        return wrapper
+
+    def _revalidate(self, path, force=False):
+        with self._lock:
+            state = self._signatures.get(path)
+            if state is None:
+                return False
+            now = time.monotonic()
+            if not force and now - state[1] < self.check_interval:
+                return False
+            state[1] = now
+            if self._signature(path) == state[0]:
+                return False
+            self._drop(path)
+            callbacks = list(self._callbacks.get(path, ()))
+        for callback in callbacks:
+            try:
+                callback(path)
+            except Exception as e:
+                logging.error(f'Reload callback {callback} failed for {path}: {e}')
+        return True
+
+    def _drop(self, path):
+        self._signatures.pop(path, None)
+        for key in [key for key in self._entries if key[1] == path]:
+            del self._entries[key]
+
+    def invalidate(self, filename=None):
+        """
+        :param filename: file to drop from the cache, None to drop everything
+        """
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+                self._signatures.clear()
+            else:
+                self._drop(os.path.abspath(filename))
+
+    def on_reload(self, filename, callback):
+        """
+        Registers callback(filename) called after the change of a cached file is detected.
+        """
+        with self._lock:
+            self._callbacks.setdefault(os.path.abspath(filename), []).append(callback)
+
+    def check_all(self):
+        """
+        Checks all cached files right away, ignoring check_interval.
+
+        :return: list of changed files
+        """
+        with self._lock:
+            paths = list(self._signatures)
+        return [path for path in paths if self._revalidate(path, force=True)]
+
+    def watch(self, interval=None):
+        """
+        Starts a daemon thread calling check_all every interval (default check_interval) seconds, so reload
+        callbacks fire without waiting for the next open_yml/open_json call.
+        """
+        if self._watcher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval or self.check_interval)
+                self.check_all()
+
+        self._watcher = threading.Thread(target=run, name='config-cache-watcher', daemon=True)
+        self._watcher.start()
+
+
+config_cache = FileCache()
+
+
+def _parse_yml(data):
+    return yaml.load(data, Loader=YamlLoader)
 
-@lru_cache(maxsize=32)
+
+def _parse_json(data):
+    return _json_loads(data)
+
+
+def _snapshot_filename(filename):
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, f".{name}.snapshot")
+
+
+def _load_file(filename, parse):
+    """
+    Reads and parses filename. If SNAPSHOTS_ENABLED and snapshot of the same content exists, returns unpickled
+    snapshot instead of parsing, otherwise parses and writes a new snapshot.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    if not SNAPSHOTS_ENABLED:
+        return parse(data)
+
+    key = (parse.__name__, hashlib.blake2b(data, digest_size=20).hexdigest())
+    snapshot_filename = _snapshot_filename(filename)
+    try:
+        with open(snapshot_filename, "rb") as f:
+            snapshot_key, tree = pickle.load(f)
+        if snapshot_key == key:
+            return tree
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Broken snapshot {snapshot_filename}: {e}")
+
+    tree = parse(data)
+    tmp_filename = f"{snapshot_filename}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_filename, "wb") as f:
+            pickle.dump((key, tree), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, snapshot_filename)
+    except OSError as e:
+        logging.warning(f"Failed to write snapshot {snapshot_filename}: {e}")
+    return tree
+
+
+@config_cache.cached
 def open_yml(filename, as_dict=False, top_key=None):
     """
     Opens a YML file and returns it's content either as dictionary or as instance of MyNamespace. Cached by
-    built-in lru_cache module.
+    config_cache, changes of the file are picked up after config_cache.check_interval seconds.
+    Parsed with libyaml CSafeLoader if available, see also SNAPSHOTS_ENABLED.
 
     :param filename: filename to open
     :param frozen_js: True to return MyNamespace, False to return dict
     :param top_key: if specified the returned instance will only include items from this key onwards.
     :return:
     """
-    with open(filename, "r", encoding="UTF8") as f:
-        if not top_key:
-            yaml_file = yaml.load(f)
-        else:
-            yaml_file = yaml.load(f)[top_key]
+    yaml_file = _load_file(filename, _parse_yml)
+    if top_key:
+        yaml_file = yaml_file[top_key]
     if as_dict:
         return yaml_file
     return MyNamespace(yaml_file)
 
 
-@lru_cache(maxsize=32)
+@config_cache.cached
 def open_json(filename, as_dict=False, top_key=None):
     """
     Opens a YML file and returns it's content either as dictionary or as instance of MyNamespace. Cached by
-    built-in lru_cache module.
+    config_cache, changes of the file are picked up after config_cache.check_interval seconds.
+    Parsed with orjson if available, see also SNAPSHOTS_ENABLED.
 
     :param filename: filename to open
     :param frozen_js: True to return MyNamespace, False to return dict
     :param top_key: if specified the returned instance will only include items from this key onwards.
     :return:
     """
-    with open(filename, "r", encoding="UTF-8") as f:
-        if not top_key:
-            dic = json.load(f)
-        else:
-            dic = json.load(f)[top_key]
+    dic = _load_file(filename, _parse_json)
+    if top_key:
+        dic = dic[top_key]
     if as_dict:
         return dic
     return MyNamespace(dic)
 
 
+class _MissingKeyError(KeyError, AttributeError):
+    """
+    Raised for missing keys. AttributeError for backwards compatibility, KeyError for the Mapping protocol.
+    """
+
+
 class MyNamespace(UserDict):
+    """
+    Read-only view of a mapping with both attribute and item access. Keys which are python keywords get a "_"
+    suffix (ns.class_, ns['class_']).
+
+    The original mapping is wrapped, not copied. Nested mappings and lists are converted on first access and
+    memoized, keys()/values()/items() return views. Keys which clash with method names (e.g. "items") are
+    available via item access only.
+    """
+
     def __init__(self, mapping):
-        self.__keys = set()
-        for key, value in mapping.items():
-            if iskeyword(key):
-                key += "_"
-            setattr(self, key, self.build(value))
-            self.__keys.add(key)
+        if any(map(_is_keyword, mapping)):
+            mapping = {key + "_" if _is_keyword(key) else key: value for key, value in mapping.items()}
+        object.__setattr__(self, "_MyNamespace__data", mapping)
+        object.__setattr__(self, "_MyNamespace__converted", {})
 
     @classmethod
     def build(cls, value):
-        if isinstance(value, abc.Mapping):
+        if isinstance(value, abc.Mapping) and not isinstance(value, MyNamespace):
             return cls(value)
         elif isinstance(value, abc.MutableSequence):
             return [cls.build(item) for item in value]
         else:
             return value
 
-    def keys(self):
-        return list(self.__keys)
+    def __getitem__(self, item):
+        try:
+            return self.__converted[item]
+        except KeyError:
+            pass
+        try:
+            value = self.__data[item]
+        except (KeyError, TypeError):
+            raise _MissingKeyError(f'{item}') from None
+        value = self.build(value)
+        self.__converted[item] = value
+        if isinstance(item, str) and not hasattr(type(self), item):
+            # Next attribute access skips __getattr__
+            object.__setattr__(self, item, value)
+        return value
 
-    def values(self):
-        return [getattr(self, key) for key in self.__keys]
+    def __getattr__(self, item):
+        if item.startswith("_MyNamespace__"):
+            raise AttributeError(item)
+        return self[item]
 
-    def items(self):
-        return [(key, getattr(self, key)) for key in self.__keys]
+    def __contains__(self, item):
+        return item in self.__data
 
-    def __getitem__(self, item):
-        if hasattr(self, item):
-            return getattr(self, item)
-        raise AttributeError(f'{item}')
+    def get(self, key, default=None):
+        if key in self.__data:
+            return self[key]
+        return default
 
     def __repr__(self):
-        copy = self.__dict__.copy()
-        del copy['_MyNamespace__keys']
-        return f"MyNamespace({copy})"
+        return f"MyNamespace({dict(self.items())})"
+
+    def __reduce__(self):
+        return type(self), (self.__data,)
+
+    def __copy__(self):
+        return self
+
+    def copy(self):
+        return self
+
+    def __setattr__(self, key, value):
+        raise TypeError('MyNamespace object does not support attribute assignment')
+
+    def __delattr__(self, item):
+        raise TypeError('MyNamespace object does not support attribute deletion')
 
     def __delitem__(self, key):
         raise TypeError('MyNamespace object does not support item assignment')
@@ -97,8 +345,11 @@ class MyNamespace(UserDict):
         raise TypeError('MyNamespace object does not support item assignment')
 
     def __len__(self):
-        return len(self.__keys)
+        return len(self.__data)
 
     def __iter__(self):
-        for i in self.__keys:
-            yield i
+        return iter(self.__data)
+
+
+def _is_keyword(key):
+    return isinstance(key, str) and iskeyword(key)
@@ -0,0 +1,300 @@
+import json
+import re
+
+from .blaster_open_yml_json import MyNamespace
+
+try:
+    # pip install PyYAML
+    import yaml
+    from yaml.composer import Composer
+    from yaml.constructor import SafeConstructor
+    from yaml.events import CollectionEndEvent, CollectionStartEvent, MappingStartEvent, ScalarEvent
+    from yaml.resolver import Resolver
+
+    from .blaster_open_yml_json import YamlLoader
+
+
+    class _YmlEventLoader(Composer, SafeConstructor, Resolver):
+        """
+        Composes and constructs a single node from _YmlEvents, same result as yaml.safe_load of that node.
+        """
+
+        def __init__(self, events):
+            self._events = events
+            Composer.__init__(self)
+            SafeConstructor.__init__(self)
+            Resolver.__init__(self)
+            self.anchors = events.anchors
+
+        def check_event(self, *choices):
+            event = self._events.peek()
+            return not choices or isinstance(event, choices)
+
+        def peek_event(self):
+            return self._events.peek()
+
+        def get_event(self):
+            return self._events.get()
+
+        def load(self):
+            node = self.compose_node(None, None)
+            return self.construct_document(node)
+except ModuleNotFoundError:
+    pass
+
+CHUNK_SIZE = 64 * 1024
+
+
+def load_json_key(filename, top_key, as_dict=False):
+    """
+    Returns value of top_key of the top-level JSON object without parsing the rest of the file. Only the requested
+    value and one other top-level value at a time are kept in memory.
+
+    :param filename: filename to open
+    :param top_key: key of the top-level object to return
+    :param as_dict: True to return dict, False to return MyNamespace
+    :return:
+    """
+    with open(filename, "r", encoding="UTF-8") as f:
+        reader = _JsonReader(f)
+        for key in reader.members():
+            if key == top_key:
+                return _build(reader.value(), as_dict)
+            reader.value()
+    raise KeyError(top_key)
+
+
+def iter_json(filename, top_key=None, as_dict=False):
+    """
+    Iterates items of a large JSON array or object one at a time. Yields elements for arrays and (key, value) tuples
+    for objects.
+
+    Usage:
+
+    >>> for user_id, user in iter_json('users.json', top_key='users'):
+    >>>     print(user_id, user.name)
+
+    :param filename: filename to open
+    :param top_key: if specified iterates the value of this key of the top-level object
+    :param as_dict: True to yield dicts, False to yield MyNamespace
+    :return: generator
+    """
+    with open(filename, "r", encoding="UTF-8") as f:
+        reader = _JsonReader(f)
+        if top_key is not None:
+            for key in reader.members():
+                if key == top_key:
+                    break
+                reader.value()
+            else:
+                raise KeyError(top_key)
+        if reader.peek() == "[":
+            for _ in reader.elements():
+                yield _build(reader.value(), as_dict)
+        else:
+            for key in reader.members():
+                yield key, _build(reader.value(), as_dict)
+
+
+def load_yml_key(filename, top_key, as_dict=False):
+    """
+    Returns value of top_key of the top-level YML mapping. The file is parsed into events, only the events of the
+    requested value (and anchored nodes it might refer to) are composed and constructed.
+
+    :param filename: filename to open
+    :param top_key: key of the top-level mapping to return
+    :param as_dict: True to return dict, False to return MyNamespace
+    :return:
+    """
+    with open(filename, "rb") as f:
+        events = _YmlEvents(f)
+        for key in events.members():
+            if key == top_key:
+                return _build(events.value(), as_dict)
+            events.skip()
+    raise KeyError(top_key)
+
+
+def iter_yml(filename, top_key=None, as_dict=False):
+    """
+    Same as iter_json for YML files. Yields elements for sequences and (key, value) tuples for mappings.
+
+    :param filename: filename to open
+    :param top_key: if specified iterates the value of this key of the top-level mapping
+    :param as_dict: True to yield dicts, False to yield MyNamespace
+    :return: generator
+    """
+    with open(filename, "rb") as f:
+        events = _YmlEvents(f)
+        if top_key is not None:
+            for key in events.members():
+                if key == top_key:
+                    break
+                events.skip()
+            else:
+                raise KeyError(top_key)
+        if isinstance(events.peek(), MappingStartEvent):
+            for key in events.members():
+                yield key, _build(events.value(), as_dict)
+        else:
+            for _ in events.elements():
+                yield _build(events.value(), as_dict)
+
+
+def _build(value, as_dict):
+    if as_dict:
+        return value
+    return MyNamespace.build(value)
+
+
+class _JsonReader:
+    """
+    Incremental reader of a JSON text file. Containers are walked with members()/elements(), single values are
+    decoded by the C scanner of the json module from a buffer which is refilled from the file as needed.
+    """
+
+    _whitespace = " \t\n\r"
+    _cut_number = re.compile(r"[.eE][-+]?")
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self._whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Value is cut by the end of the buffer, read as much again
+                if not self._fill(max(self.chunk_size, len(self.buffer) - self.pos)):
+                    raise
+                continue
+            # Numbers and literals at the very end of the buffer might continue in the next chunk. A number cut
+            # right after '.', 'e' or its sign ('3.', '3e', '3e-') is decoded up to that char, without an error
+            if (end == len(self.buffer) or isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and self._cut_number.fullmatch(self.buffer, end)) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _container(self, start, end):
+        self.expect(start)
+        if self.peek() == end:
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == end:
+                return
+            if char != ",":
+                raise json.JSONDecodeError(f"Expecting ',' or {end!r}", self.buffer, self.pos - 1)
+
+    def members(self):
+        """
+        Yields keys of the object at the current position. Caller must consume the value of each key.
+        """
+        for _ in self._container("{", "}"):
+            key = self.value()
+            self.expect(":")
+            yield key
+
+    def elements(self):
+        """
+        Yields once per element of the array at the current position. Caller must consume each element.
+        """
+        return self._container("[", "]")
+
+
+class _YmlEvents:
+    """
+    Same as _JsonReader for YML, walks the stream of parser events. Values are composed and constructed only when
+    requested with value(). Anchored nodes are composed even when skipped, so later aliases can be resolved.
+    """
+
+    def __init__(self, f):
+        self.events = yaml.parse(f, Loader=YamlLoader)
+        self.current = None
+        self.anchors = {}
+        next(self.events)  # StreamStartEvent
+        next(self.events)  # DocumentStartEvent
+
+    def peek(self):
+        if self.current is None:
+            self.current = next(self.events)
+        return self.current
+
+    def get(self):
+        event = self.peek()
+        self.current = None
+        return event
+
+    def skip(self):
+        depth = 0
+        while True:
+            event = self.peek()
+            if isinstance(event, (ScalarEvent, CollectionStartEvent)) and event.anchor is not None:
+                _YmlEventLoader(self).compose_node(None, None)
+            else:
+                self.get()
+                if isinstance(event, CollectionStartEvent):
+                    depth += 1
+                elif isinstance(event, CollectionEndEvent):
+                    depth -= 1
+            if depth == 0:
+                return
+
+    def value(self):
+        return _YmlEventLoader(self).load()
+
+    def _container(self):
+        self.get()
+        while not isinstance(self.peek(), CollectionEndEvent):
+            yield
+        self.get()
+
+    def members(self):
+        """
+        Yields keys of the mapping at the current position. Caller must consume the value of each key.
+        """
+        if not isinstance(self.peek(), MappingStartEvent):
+            raise TypeError(f"Expected a mapping, got {self.peek()}")
+        for _ in self._container():
+            yield self.value()
+
+    def elements(self):
+        """
+        Yields once per element of the sequence at the current position. Caller must consume each element.
+        """
+        return self._container()
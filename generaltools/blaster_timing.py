@@ -0,0 +1,173 @@
+import math
+import threading
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    Streaming histogram with logarithmic buckets. Memory is bounded by the number of buckets between min_value and
+    max_value (~480 buckets with default settings), relative error of a quantile is about (growth - 1) / 2.
+
+    Usage:
+
+    >>> hist = LatencyHistogram()
+    >>> for duration in (0.1, 0.2, 0.3):
+    >>>     hist.add(duration)
+    >>> hist.quantile(0.5)
+    0.2003...
+
+    :param min_value: smallest distinguishable value in seconds, smaller values go to the first bucket
+    :param max_value: largest distinguishable value in seconds, larger values go to the last bucket
+    :param growth: ratio between bounds of two neighbouring buckets
+    """
+
+    def __init__(self, min_value=1e-6, max_value=3600, growth=1.05):
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self._max_index = self._index(max_value)
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_growth) + 1
+
+    def _value(self, index):
+        if index == 0:
+            return self.min_value
+        # Geometric middle of the bucket
+        return self.min_value * self.growth ** (index - 0.5)
+
+    def add(self, value):
+        index = min(self._index(value), self._max_index)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        :param q: quantile between 0 and 1
+        :return: approximate value, None if histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+
+class FunctionTimings:
+    """
+    Call count, error count and latency histogram of a single function.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.histogram = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def record(self, duration, error=False):
+        with self._lock:
+            self.calls += 1
+            if error:
+                self.errors += 1
+            self.histogram.add(duration)
+
+    def snapshot(self, quantiles=DEFAULT_QUANTILES):
+        with self._lock:
+            hist = self.histogram
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "total": hist.sum,
+                "min": hist.min,
+                "max": hist.max,
+                "mean": hist.sum / hist.count if hist.count else None,
+                "quantiles": {q: hist.quantile(q) for q in quantiles},
+            }
+
+
+class TimingRegistry:
+    """
+    Process-wide storage of FunctionTimings keyed by "module.function". Filled by @log_this, thread-safe.
+    """
+
+    def __init__(self):
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        timings = self._timings.get(name)
+        if timings is None:
+            with self._lock:
+                timings = self._timings.setdefault(name, FunctionTimings(name))
+        return timings
+
+    def record(self, name, duration, error=False):
+        self.get(name).record(duration, error)
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+
+    def snapshot(self, quantiles=DEFAULT_QUANTILES):
+        """
+        :param quantiles: quantiles to calculate
+        :return: {"module.function": {"calls": .., "errors": .., "total": .., "min": .., "max": .., "mean": ..,
+                 "quantiles": {0.5: .., 0.95: .., 0.99: ..}}}
+        """
+        with self._lock:
+            timings = list(self._timings.values())
+        return {t.name: t.snapshot(quantiles) for t in timings}
+
+    def to_prometheus(self, prefix="log_this", quantiles=DEFAULT_QUANTILES):
+        """
+        Dumps registry in Prometheus text exposition format.
+
+        :param prefix: metric name prefix
+        :param quantiles: quantiles to export
+        :return: str
+        """
+        snapshot = self.snapshot(quantiles)
+        lines = [
+            f"# HELP {prefix}_duration_seconds Execution time of functions decorated with log_this.",
+            f"# TYPE {prefix}_duration_seconds summary",
+        ]
+        for name, stats in sorted(snapshot.items()):
+            label = _escape_label(name)
+            for q, value in stats["quantiles"].items():
+                lines.append(f'{prefix}_duration_seconds{{function="{label}",quantile="{q}"}} {_number(value)}')
+            lines.append(f'{prefix}_duration_seconds_sum{{function="{label}"}} {_number(stats["total"])}')
+            lines.append(f'{prefix}_duration_seconds_count{{function="{label}"}} {stats["calls"]}')
+        lines += [
+            f"# HELP {prefix}_errors_total Exceptions raised by functions decorated with log_this.",
+            f"# TYPE {prefix}_errors_total counter",
+        ]
+        for name, stats in sorted(snapshot.items()):
+            lines.append(f'{prefix}_errors_total{{function="{_escape_label(name)}"}} {stats["errors"]}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return "NaN" if value is None else repr(float(value))
+
+
+timing_registry = TimingRegistry()
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from ..blaster_date_tools import daterange, daterange_batches
+
+
+@pytest.mark.parametrize("step", [1, timedelta(hours=1), timedelta(minutes=30)])
+def test_daterange_batches_same_as_daterange_across_dst(step):
+    pd = pytest.importorskip("pandas")
+    berlin = ZoneInfo("Europe/Berlin")
+    for start, end in [
+        (datetime(2024, 3, 30, 12, tzinfo=berlin), datetime(2024, 4, 1, tzinfo=berlin)),
+        (datetime(2024, 10, 26, 23, tzinfo=berlin), datetime(2024, 10, 28, 4, tzinfo=berlin)),
+    ]:
+        expected = list(daterange(start, end, step))
+        index = pd.DatetimeIndex([]).append(list(daterange_batches(start, end, step, batch_size=7, as_pandas=True)))
+        # same instants; a wall time in the DST gap (02:30) is only representable by datetime, pandas shows it
+        # as the equal 03:30
+        assert [date.timestamp() for date in index] == [date.timestamp() for date in expected]
+        assert index[0].to_pydatetime() == expected[0] and index[-1].to_pydatetime() == expected[-1]
+        utc = [date.astimezone(ZoneInfo("UTC")).replace(tzinfo=None) for date in expected]
+        arrays = list(daterange_batches(start, end, step, batch_size=7))
+        assert [pd.Timestamp(value).to_pydatetime() for array in arrays for value in array] == utc
+
+
+def test_daterange_batches_naive():
+    pytest.importorskip("numpy")
+    blocks = list(daterange_batches("2018-12-01", "2018-12-05", batch_size=3))
+    assert [len(block) for block in blocks] == [3, 1]
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from ..blaster_logger import log_this
+from ..blaster_timing import timing_registry
+
+
+def calls(func):
+    return timing_registry.get(f"{func.__module__}.{func.__qualname__}").calls
+
+
+@log_this
+def numbers():
+    received = yield 1
+    yield received
+
+
+@log_this
+async def async_numbers():
+    received = yield 1
+    while True:
+        try:
+            received = yield received
+        except ValueError:
+            received = "caught"
+
+
+def test_generator_closed_early_is_timed():
+    before = calls(numbers)
+    for _ in numbers():
+        break
+    assert calls(numbers) == before + 1
+
+    generator = numbers()
+    assert next(generator) == 1
+    assert generator.send(5) == 5
+
+
+def test_async_generator_forwards_asend_and_athrow():
+    async def main():
+        generator = async_numbers()
+        assert await generator.__anext__() == 1
+        assert await generator.asend(5) == 5
+        assert await generator.athrow(ValueError) == "caught"
+        with pytest.raises(KeyError):
+            await generator.athrow(KeyError)
+        with pytest.raises(StopAsyncIteration):
+            await generator.__anext__()
+
+    before = calls(async_numbers)
+    asyncio.run(main())
+    assert calls(async_numbers) == before + 1
+    assert timing_registry.get(f"{async_numbers.__module__}.{async_numbers.__qualname__}").errors >= 1
+
+
+def test_async_generator_closed_early_is_timed():
+    async def main():
+        async for _ in async_numbers():
+            break
+
+    before = calls(async_numbers)
+    asyncio.run(main())
+    assert calls(async_numbers) == before + 1
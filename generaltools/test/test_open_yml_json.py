@@ -0,0 +1,142 @@
+import json
+import os
+import pickle
+
+import pytest
+
+from .. import blaster_open_yml_json
+from ..blaster_open_yml_json import FileCache, MyNamespace, _json_loads, _load_file, _parse_json, _parse_yml
+
+
+def make_loader(cache):
+    loads = []
+
+    @cache.cached
+    def load(filename, as_dict=False, top_key=None):
+        loads.append(filename)
+        with open(filename) as f:
+            return f.read()
+
+    return load, loads
+
+
+def test_file_cache_hits_until_file_changes(tmp_path):
+    path = tmp_path / "config.yml"
+    path.write_text("a: 1")
+    cache = FileCache(check_interval=0)
+    reloaded = []
+    cache.on_reload(str(path), reloaded.append)
+    load, loads = make_loader(cache)
+
+    assert load(str(path)) == "a: 1"
+    assert load(str(path)) == "a: 1"
+    assert len(loads) == 1
+
+    path.write_text("a: 22")
+    assert load(str(path)) == "a: 22"
+    assert len(loads) == 2
+    assert reloaded == [os.path.abspath(path)]
+
+
+def test_file_cache_checks_mtime_once_per_interval(tmp_path):
+    path = tmp_path / "config.yml"
+    path.write_text("a: 1")
+    cache = FileCache(check_interval=3600)
+    load, loads = make_loader(cache)
+    load(str(path))
+
+    path.write_text("a: 22")
+    assert load(str(path)) == "a: 1"
+    assert cache.check_all() == [os.path.abspath(path)]
+    assert load(str(path)) == "a: 22"
+
+    # same size, only the mtime differs
+    path.write_text("a: 33")
+    os.utime(path, ns=(0, 0))
+    assert cache.check_all() == [os.path.abspath(path)]
+
+
+def test_file_cache_invalidate(tmp_path):
+    path = tmp_path / "config.yml"
+    path.write_text("a: 1")
+    cache = FileCache()
+    load, loads = make_loader(cache)
+    load(str(path))
+    load(str(path), as_dict=True)
+    assert len(loads) == 2
+
+    load.cache_clear(str(path))
+    load(str(path))
+    assert len(loads) == 3
+
+
+def test_namespace_converts_lazily_and_memoizes():
+    data = {"db": {"host": "localhost", "ports": [{"port": 1}]}, "name": "bot"}
+    ns = MyNamespace(data)
+    assert ns._MyNamespace__converted == {}
+
+    db = ns.db
+    assert isinstance(db, MyNamespace) and list(ns._MyNamespace__converted) == ["db"]
+    assert ns.db is db and ns["db"] is db
+    assert db.ports[0].port == 1
+    # wrapped, not copied
+    assert db._MyNamespace__data is data["db"]
+
+
+def test_namespace_keys_clashing_with_methods_are_item_only():
+    ns = MyNamespace({"items": [1], "get": 2, "class": 3})
+    assert ns["items"] == [1] and ns["get"] == 2
+    assert callable(ns.items) and ns.get("get") == 2
+    assert ns.class_ == 3 and ns["class_"] == 3
+    assert dict(ns.items()) == {"items": [1], "get": 2, "class_": 3}
+
+
+def test_namespace_is_read_only_and_picklable():
+    ns = MyNamespace({"a": {"b": 1}})
+    with pytest.raises(TypeError):
+        ns.a = 2
+    with pytest.raises(TypeError):
+        ns["a"] = 2
+    with pytest.raises(KeyError):
+        ns["missing"]
+    with pytest.raises(AttributeError):
+        ns.missing
+    assert pickle.loads(pickle.dumps(ns)).a.b == 1
+
+
+@pytest.mark.parametrize("document", [
+    '{"a": [1, 2.5, "x", null, true], "b": {"c": "\\u00e9\\ud83d\\ude00"}}',
+    '{"big": 123456789012345678901234567890, "small": -18446744073709551617}',
+    '[NaN, Infinity, -Infinity]',
+    '1e400',
+])
+def test_json_loads_same_as_json(document):
+    expected = json.loads(document)
+    result = _json_loads(document.encode())
+    assert repr(result) == repr(expected)
+
+
+def test_yml_parser_same_as_safe_load():
+    yaml = pytest.importorskip("yaml")
+    document = "a: &x {b: [1, 2.5, null, yes]}\nc:\n  <<: *x\n  d: 2019-01-01\n"
+    assert _parse_yml(document.encode()) == yaml.safe_load(document)
+
+
+def test_snapshot_is_used_for_unchanged_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(blaster_open_yml_json, "SNAPSHOTS_ENABLED", True)
+    path = tmp_path / "config.json"
+    path.write_text('{"a": 1}')
+    parsed = []
+
+    def parse(data):
+        parsed.append(data)
+        return _parse_json(data)
+
+    assert _load_file(str(path), parse) == {"a": 1}
+    assert _load_file(str(path), parse) == {"a": 1}
+    assert len(parsed) == 1
+    assert (tmp_path / ".config.json.snapshot").exists()
+
+    path.write_text('{"a": 2}')
+    assert _load_file(str(path), parse) == {"a": 2}
+    assert len(parsed) == 2
@@ -0,0 +1,114 @@
+import io
+import json
+import random
+
+import pytest
+
+from ..blaster_stream_yml_json import _JsonReader, iter_json, iter_yml, load_json_key, load_yml_key
+
+
+def _random_value(rnd, depth=0):
+    kind = rnd.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        return rnd.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rnd.choice([3.25, -0.5, 1e-7, 2.5e+20, 123.456, -1.0E-3])
+    if kind == 2:
+        return "".join(rnd.choice('ab "\\\\é.e') for _ in range(rnd.randrange(6)))
+    if kind == 3:
+        return rnd.choice([True, False, None])
+    if kind == 4:
+        return rnd.randint(0, 9)
+    if kind in (5, 6):
+        return {f"k{i}": _random_value(rnd, depth + 1) for i in range(rnd.randrange(4))}
+    return [_random_value(rnd, depth + 1) for _ in range(rnd.randrange(4))]
+
+
+def _read(reader):
+    if reader.peek() == "{":
+        return {key: _read(reader) for key in reader.members()}
+    if reader.peek() == "[":
+        return [_read(reader) for _ in reader.elements()]
+    return reader.value()
+
+
+def test_json_reader_small_chunks():
+    rnd = random.Random(7)
+    for _ in range(200):
+        document = {f"top{i}": _random_value(rnd) for i in range(rnd.randrange(1, 5))}
+        text = json.dumps(document, indent=rnd.choice([None, 1]))
+        for chunk_size in range(1, 8):
+            assert _read(_JsonReader(io.StringIO(text), chunk_size=chunk_size)) == document
+
+
+def test_number_cut_after_point_at_default_chunk(tmp_path):
+    # the first 64 KiB chunk ends right after "3."
+    path = tmp_path / "cut.json"
+    path.write_text(json.dumps({"pad": "x" * 65517, "v": 3.25, "w": 1}))
+    assert load_json_key(str(path), "w") == 1
+    assert [key for key, _ in iter_json(str(path))] == ["pad", "v", "w"]
+
+
+def test_json_missing_key(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps({"a": [1, {"b": 2}]}))
+    assert load_json_key(str(path), "a", as_dict=True) == [1, {"b": 2}]
+    with pytest.raises(KeyError):
+        load_json_key(str(path), "missing")
+    with pytest.raises(KeyError):
+        list(iter_json(str(path), top_key="missing"))
+
+
+def test_yml_keys_same_as_safe_load(tmp_path):
+    yaml = pytest.importorskip("yaml")
+    rnd = random.Random(7)
+    path = tmp_path / "data.yml"
+    for _ in range(50):
+        document = {f"top{i}": _random_value(rnd) for i in range(rnd.randrange(1, 5))}
+        path.write_text(yaml.safe_dump(document, default_flow_style=rnd.choice([None, False])))
+        expected = yaml.safe_load(path.read_text())
+        for key in expected:
+            assert load_yml_key(str(path), key, as_dict=True) == expected[key]
+        assert dict(iter_yml(str(path), as_dict=True)) == expected
+
+
+YML_WITH_ANCHORS = """
+defaults: &defaults
+  adapter: postgres
+  pool: &pool {size: 5, nested: [1, &one 1]}
+skipped:
+  deep: [{x: &deep deep value}]
+development:
+  <<: *defaults
+  database: dev
+  pool: *pool
+  deep: *deep
+  one: *one
+users:
+  - name: a
+    <<: *defaults
+  - *deep
+"""
+
+
+def test_yml_anchors_and_merge_keys(tmp_path):
+    yaml = pytest.importorskip("yaml")
+    path = tmp_path / "data.yml"
+    path.write_text(YML_WITH_ANCHORS)
+    expected = yaml.safe_load(YML_WITH_ANCHORS)
+
+    development = load_yml_key(str(path), "development", as_dict=True)
+    assert development == expected["development"]
+    assert development["adapter"] == "postgres" and development["deep"] == "deep value"
+    assert list(iter_yml(str(path), top_key="users", as_dict=True)) == expected["users"]
+    assert load_yml_key(str(path), "development").pool.size == 5
+
+
+def test_yml_missing_key(tmp_path):
+    pytest.importorskip("yaml")
+    path = tmp_path / "data.yml"
+    path.write_text(YML_WITH_ANCHORS)
+    with pytest.raises(KeyError):
+        load_yml_key(str(path), "missing")
+    with pytest.raises(KeyError):
+        list(iter_yml(str(path), top_key="missing"))
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from ..blaster_timing import LatencyHistogram, TimingRegistry
+
+
+def test_histogram_quantiles_of_uniform_distribution():
+    hist = LatencyHistogram()
+    values = [i / 1000 for i in range(1, 1001)]
+    random.Random(0).shuffle(values)
+    for value in values:
+        hist.add(value)
+
+    # relative error is about (growth - 1) / 2
+    for q in (0.1, 0.5, 0.95, 0.99):
+        assert hist.quantile(q) == pytest.approx(q, rel=0.03)
+    assert hist.quantile(0) == 0.001
+    assert hist.quantile(1) == 1.0
+    assert hist.count == 1000 and hist.sum == pytest.approx(500.5)
+
+
+def test_histogram_quantiles_of_two_clusters():
+    hist = LatencyHistogram()
+    for _ in range(90):
+        hist.add(0.01)
+    for _ in range(10):
+        hist.add(2.0)
+
+    assert hist.quantile(0.5) == pytest.approx(0.01, rel=0.03)
+    assert hist.quantile(0.9) == pytest.approx(0.01, rel=0.03)
+    assert hist.quantile(0.95) == pytest.approx(2.0, rel=0.03)
+
+
+def test_histogram_clamps_to_range_and_empty():
+    hist = LatencyHistogram(min_value=0.001, max_value=1)
+    assert hist.quantile(0.5) is None
+    hist.add(0)
+    hist.add(10)
+    # values out of range are counted in the first and the last bucket
+    assert len(hist.buckets) == 2
+    assert hist.quantile(0) == 0.001
+    assert hist.quantile(1) == pytest.approx(1, rel=0.03)
+    assert (hist.min, hist.max) == (0, 10)
+
+
+def test_registry_snapshot():
+    registry = TimingRegistry()
+    registry.record("mod.f", 0.5)
+    registry.record("mod.f", 0.5, error=True)
+
+    stats = registry.snapshot(quantiles=(0.5,))["mod.f"]
+    assert stats == {"calls": 2, "errors": 1, "total": 1.0, "min": 0.5, "max": 0.5, "mean": 0.5,
+                     "quantiles": {0.5: 0.5}}
+
+
+def test_prometheus_exposition_format():
+    registry = TimingRegistry()
+    registry.record("mod.f", 0.25)
+    registry.record("mod.f", 0.25, error=True)
+    registry.record('mod."g"', 2)
+    registry.get("mod.unused")
+
+    assert registry.to_prometheus(prefix="app", quantiles=(0.5, 0.99)) == (
+        '# HELP app_duration_seconds Execution time of functions decorated with log_this.\n'
+        '# TYPE app_duration_seconds summary\n'
+        'app_duration_seconds{function="mod.\\"g\\"",quantile="0.5"} 2.0\n'
+        'app_duration_seconds{function="mod.\\"g\\"",quantile="0.99"} 2.0\n'
+        'app_duration_seconds_sum{function="mod.\\"g\\""} 2.0\n'
+        'app_duration_seconds_count{function="mod.\\"g\\""} 1\n'
+        'app_duration_seconds{function="mod.f",quantile="0.5"} 0.25\n'
+        'app_duration_seconds{function="mod.f",quantile="0.99"} 0.25\n'
+        'app_duration_seconds_sum{function="mod.f"} 0.5\n'
+        'app_duration_seconds_count{function="mod.f"} 2\n'
+        'app_duration_seconds{function="mod.unused",quantile="0.5"} NaN\n'
+        'app_duration_seconds{function="mod.unused",quantile="0.99"} NaN\n'
+        'app_duration_seconds_sum{function="mod.unused"} 0.0\n'
+        'app_duration_seconds_count{function="mod.unused"} 0\n'
+        '# HELP app_errors_total Exceptions raised by functions decorated with log_this.\n'
+        '# TYPE app_errors_total counter\n'
+        'app_errors_total{function="mod.\\"g\\""} 0\n'
+        'app_errors_total{function="mod.f"} 1\n'
+        'app_errors_total{function="mod.unused"} 0\n'
+    )
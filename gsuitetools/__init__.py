@@ -1 +1,3 @@
-from .sheets import make_sheets_api_service, get_data_from_google_spreadsheet
+from .sheets import make_sheets_api_service, make_drive_api_service, get_data_from_google_spreadsheet, \
+    get_many_ranges, iter_sheet_rows
+from .sheets_cache import SheetsCache
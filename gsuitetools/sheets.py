@@ -1,23 +1,69 @@
-import pandas as pd
+import threading
+import warnings
 
-from googleapiclient.discovery import build
-from httplib2 import Http
-from oauth2client import file, client, tools
+try:
+    # pip install pandas
+    import pandas as pd
+except ModuleNotFoundError:
+    pass
 
-SCOPES = 'https://www.googleapis.com/auth/spreadsheets'
+try:
+    # pip install google-api-python-client oauth2client
+    from googleapiclient.discovery import build
+    from httplib2 import Http
+    from oauth2client import file, client, tools
+except ModuleNotFoundError:
+    pass
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    # Spreadsheet version for SheetsCache revision checks
+    'https://www.googleapis.com/auth/drive.metadata.readonly',
+]
+# Ranges per batchGet request, keeps the request URL short enough
+BATCH_GET_MAX_RANGES = 100
+
+# {(api, version, token file): service} of the current thread
+_services = threading.local()
 
 
 def make_sheets_api_service(token_json_filename):
+    """
+    Service is built once per token file and thread and reused, building it fetches the discovery document.
+    Like httplib2.Http it's not thread-safe, so every thread gets its own.
+    """
+    return _cached_service("sheets", "v4", token_json_filename)
+
+
+def make_drive_api_service(token_json_filename):
+    """
+    Drive API service for the same token, reused per thread like make_sheets_api_service. Used by SheetsCache to
+    read spreadsheet versions, the token needs the drive.metadata.readonly scope.
+    """
+    return _cached_service("drive", "v3", token_json_filename)
+
+
+def _cached_service(api, version, token_json_filename):
+    services = getattr(_services, "services", None)
+    if services is None:
+        services = _services.services = {}
+    key = (api, version, token_json_filename)
+    if key not in services:
+        services[key] = build(api, version, http=_authorize(token_json_filename))
+    return services[key]
+
+
+def _authorize(token_json_filename):
     store = file.Storage(token_json_filename)
     cred = store.get()
     if not cred or cred.invalid:
         flow = client.flow_from_clientsecrets("credentials.json", SCOPES)
         cred = tools.run_flow(flow, store)
-    service = build("sheets", "v4", http=cred.authorize(Http()))
-    return service
+    return cred.authorize(Http())
 
 
-def get_data_from_google_spreadsheet(service, spreadsheet_id, range_name, as_df=False):
+def get_data_from_google_spreadsheet(service, spreadsheet_id, range_name, as_df=False, header=False,
+                                     infer_types=False):
     result = (
         service.spreadsheets().values().get(
             spreadsheetId=spreadsheet_id,
@@ -27,10 +73,139 @@ def get_data_from_google_spreadsheet(service, spreadsheet_id, range_name, as_df=
     if result:
         if not as_df:
             return result.get("values")
-        return df_from_result(result.get('values'))
+        return df_from_result(result.get('values'), header=header, infer_types=infer_types)
+
+
+def get_many_ranges(service, spreadsheet_id, ranges, as_df=False, header=False, infer_types=False,
+                    value_render_option=None, batch_size=BATCH_GET_MAX_RANGES):
+    """
+    Reads many ranges with values().batchGet, batch_size ranges per request instead of one request per range.
 
+    Usage:
+
+    >>> data = get_many_ranges(service, spreadsheet_id, ["Sales!A1:F", "Costs!A1:C"], as_df=True, header=True)
+    >>> data["Sales!A1:F"]
+
+    :param ranges: list of ranges in A1 notation
+    :param as_df: True to return DataFrames, see df_from_result
+    :param header: with as_df, True to use the first row as column names
+    :param infer_types: with as_df, True to convert numeric and date columns
+    :param value_render_option: FORMATTED_VALUE (API default), UNFORMATTED_VALUE or FORMULA
+    :param batch_size: ranges per request
+    :return: {range: list of rows (or DataFrame, None if empty)} in order of ranges
+    """
+    ranges = list(ranges)
+    result = {}
+    for start in range(0, len(ranges), batch_size):
+        batch = ranges[start:start + batch_size]
+        kwargs = {"valueRenderOption": value_render_option} if value_render_option else {}
+        response = service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=batch,
+            **kwargs).execute()
+        # valueRanges come in order of the requested ranges, with normalized range names
+        for range_name, value_range in zip(batch, response.get("valueRanges", [])):
+            values = value_range.get("values", [])
+            result[range_name] = df_from_result(values, header=header, infer_types=infer_types) if as_df else values
+    return result
 
-def df_from_result(result):
+
+def iter_sheet_rows(service, spreadsheet_id, sheet_name, block_size=1000, as_df=False, header=False,
+                    infer_types=False, value_render_option=None):
+    """
+    Streams a large sheet in blocks of block_size rows, one request per block, so the whole sheet is never in
+    memory at once. Row count is taken from the sheet properties, so empty blocks in the middle don't stop it.
+
+    Usage:
+
+    >>> for block in iter_sheet_rows(service, spreadsheet_id, "Log", block_size=5000, as_df=True, header=True):
+    ...     process(block)
+
+    :param sheet_name: title of the sheet (tab)
+    :param block_size: rows per request
+    :param as_df: True to yield DataFrames
+    :param header: with as_df, True if the first row holds column names, they are used for every block
+    :param infer_types: with as_df, True to convert numeric and date columns, per block
+    :param value_render_option: FORMATTED_VALUE (API default), UNFORMATTED_VALUE or FORMULA
+    :return: generator of lists of rows or DataFrames
+    """
+    row_count = _sheet_row_count(service, spreadsheet_id, sheet_name)
+    kwargs = {"valueRenderOption": value_render_option} if value_render_option else {}
+    quoted_name = "'" + sheet_name.replace("'", "''") + "'"
+    columns = None
+    first_row = 1
+    if as_df and header:
+        columns = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{quoted_name}!1:1",
+            **kwargs).execute().get("values", [[]])[0]
+        first_row = 2
+
+    for start in range(first_row, row_count + 1, block_size):
+        end = min(start + block_size - 1, row_count)
+        values = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{quoted_name}!{start}:{end}",
+            **kwargs).execute().get("values", [])
+        if not values:
+            continue
+        if as_df:
+            yield df_from_result(values, columns=columns, infer_types=infer_types)
+        else:
+            yield values
+
+
+def _sheet_row_count(service, spreadsheet_id, sheet_name):
+    spreadsheet = service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields="sheets.properties(title,gridProperties.rowCount)").execute()
+    for sheet in spreadsheet.get("sheets", []):
+        properties = sheet["properties"]
+        if properties["title"] == sheet_name:
+            return properties["gridProperties"]["rowCount"]
+    raise KeyError(f"No sheet {sheet_name} in spreadsheet {spreadsheet_id}")
+
+
+def df_from_result(result, header=False, infer_types=False, columns=None):
+    """
+    :param result: list of rows
+    :param header: True to use the first row as column names
+    :param infer_types: True to convert columns where every non-empty value is a number to numeric dtype, and
+        where every non-empty value is a date to datetime64. Empty cells become NaN/NaT
+    :param columns: column names, if the header row was read separately. Columns past them are named column_<n>
+    :return: DataFrame, None if result is empty
+    """
     if result:
-        return pd.DataFrame(result)
+        if header:
+            columns, result = result[0], result[1:]
+        if columns is not None:
+            # Sheets API drops trailing empty cells, rows are padded to the header width. Cells past the header get
+            # generated column names instead of being dropped
+            width = max(len(columns), max((len(row) for row in result), default=0))
+            columns = list(columns) + [f"column_{i + 1}" for i in range(len(columns), width)]
+            result = [row + [""] * (width - len(row)) for row in result]
+        df = pd.DataFrame(result, columns=columns)
+        if infer_types:
+            _infer_dtypes(df)
+        return df
+
 
+def _infer_dtypes(df):
+    # By position, header names may be blank or duplicate
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        values = column.mask(column == "")
+        present = values.notna()
+        if not present.any():
+            continue
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric[present].notna().all():
+            df.isetitem(i, numeric)
+            continue
+        if values[present].map(lambda value: isinstance(value, str)).all():
+            with warnings.catch_warnings():
+                # "Could not infer format" when formats are mixed
+                warnings.simplefilter("ignore", UserWarning)
+                dates = pd.to_datetime(values, errors="coerce")
+            if dates[present].notna().all():
+                df.isetitem(i, dates)
@@ -0,0 +1,149 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from .sheets import df_from_result, get_many_ranges
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets_cache (
+    spreadsheet_id TEXT NOT NULL,
+    range_name TEXT NOT NULL,
+    value_render_option TEXT NOT NULL,
+    revision TEXT,
+    checked_at REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (spreadsheet_id, range_name, value_render_option)
+);
+"""
+
+
+class SheetsCache:
+    """
+    On-disk cache of range values in SQLite, shared by all processes using the same file (e.g. cron jobs).
+
+    A cached range is returned without any request for ttl seconds after it was last checked. After that the
+    spreadsheet version is read from the Drive API, one small request per spreadsheet, and ranges are downloaded
+    again only if the version changed. Without drive_service, or if the version can't be read, ranges are
+    downloaded again after ttl.
+
+    Usage:
+
+    >>> cache = SheetsCache("sheets_cache.sqlite3", ttl=600, drive_service=make_drive_api_service("token.json"))
+    >>> service = make_sheets_api_service("token.json")
+    >>> values = cache.get_data(service, spreadsheet_id, "Sales!A1:F")
+    >>> frames = cache.get_many_ranges(service, spreadsheet_id, ["Sales!A1:F", "Costs!A1:C"], as_df=True, header=True)
+
+    :param path: SQLite database file
+    :param ttl: seconds a range is used without checking the version, 0 to check on every read
+    :param drive_service: Drive API v3 service, see make_drive_api_service
+    """
+
+    def __init__(self, path="sheets_cache.sqlite3", ttl=600, drive_service=None):
+        self.ttl = ttl
+        self.drive_service = drive_service
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def get_data(self, service, spreadsheet_id, range_name, as_df=False, header=False, infer_types=False,
+                 value_render_option=None):
+        """
+        Cached get_data_from_google_spreadsheet.
+
+        :return: list of rows (or DataFrame), None if the range is empty
+        """
+        return self.get_many_ranges(service, spreadsheet_id, [range_name], as_df=as_df, header=header,
+                                    infer_types=infer_types, value_render_option=value_render_option)[range_name]
+
+    def get_many_ranges(self, service, spreadsheet_id, ranges, as_df=False, header=False, infer_types=False,
+                        value_render_option=None):
+        """
+        Cached get_many_ranges, only ranges which are missing or changed are downloaded, with one batchGet.
+
+        :return: {range: list of rows (None if empty) or DataFrame} in order of ranges
+        """
+        ranges = list(dict.fromkeys(ranges))
+        render_option = value_render_option or "FORMATTED_VALUE"
+        cached = self._load(spreadsheet_id, ranges, render_option)
+        now = time.time()
+        stale = [range_name for range_name in ranges
+                 if range_name not in cached or now - cached[range_name][1] >= self.ttl]
+
+        if stale:
+            # Version is read before the download: if the sheet changes in between, newer values are stored with
+            # the older version and simply downloaded once more next time
+            revision = self._revision(spreadsheet_id)
+            unchanged = [range_name for range_name in stale
+                         if revision is not None and range_name in cached and cached[range_name][0] == revision]
+            if unchanged:
+                self._touch(spreadsheet_id, unchanged, render_option, now)
+            to_download = [range_name for range_name in stale if range_name not in unchanged]
+            if to_download:
+                downloaded = get_many_ranges(service, spreadsheet_id, to_download,
+                                             value_render_option=value_render_option)
+                self._store(spreadsheet_id, downloaded, render_option, revision, now)
+                cached.update((range_name, (revision, now, values)) for range_name, values in downloaded.items())
+            logging.debug(f"Spreadsheet {spreadsheet_id} version {revision}: {len(unchanged)} ranges unchanged, "
+                          f"{len(to_download)} downloaded")
+
+        result = {}
+        for range_name in ranges:
+            values = cached[range_name][2]
+            result[range_name] = df_from_result(values, header=header, infer_types=infer_types) if as_df \
+                else values or None
+        return result
+
+    def _revision(self, spreadsheet_id):
+        if self.drive_service is None:
+            return None
+        try:
+            response = self.drive_service.files().get(fileId=spreadsheet_id, fields="version").execute()
+            return str(response["version"])
+        except Exception as e:
+            logging.warning(f"Can't read version of spreadsheet {spreadsheet_id}, using ttl only: {e}")
+            return None
+
+    def _load(self, spreadsheet_id, ranges, render_option):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT range_name, revision, checked_at, payload FROM sheets_cache "
+                f"WHERE spreadsheet_id = ? AND value_render_option = ? "
+                f"AND range_name IN ({', '.join('?' * len(ranges))})",
+                (spreadsheet_id, render_option, *ranges),
+            ).fetchall()
+        return {range_name: (revision, checked_at, json.loads(payload))
+                for range_name, revision, checked_at, payload in rows}
+
+    def _touch(self, spreadsheet_id, ranges, render_option, now):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE sheets_cache SET checked_at = ? "
+                "WHERE spreadsheet_id = ? AND range_name = ? AND value_render_option = ?",
+                [(now, spreadsheet_id, range_name, render_option) for range_name in ranges],
+            )
+
+    def _store(self, spreadsheet_id, values_by_range, render_option, revision, now):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sheets_cache "
+                "(spreadsheet_id, range_name, value_render_option, revision, checked_at, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(spreadsheet_id, range_name, render_option, revision, now, json.dumps(values))
+                 for range_name, values in values_by_range.items()],
+            )
+
+    def invalidate(self, spreadsheet_id=None):
+        """
+        Drops cached ranges of spreadsheet_id, everything if None.
+        """
+        with self._lock:
+            if spreadsheet_id is None:
+                self._db.execute("DELETE FROM sheets_cache")
+            else:
+                self._db.execute("DELETE FROM sheets_cache WHERE spreadsheet_id = ?", (spreadsheet_id,))
+
+    def close(self):
+        self._db.close()
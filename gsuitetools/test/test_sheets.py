@@ -0,0 +1,120 @@
+import re
+import threading
+
+import pytest
+
+from .. import sheets
+from ..sheets import df_from_result, get_many_ranges, iter_sheet_rows, make_sheets_api_service
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeService:
+    """
+    Fake of the Sheets API service, serves one sheet from a list of rows and records the requests.
+    """
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.calls = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range=None, fields=None, **kwargs):
+        if range is None:
+            self.calls.append(("spreadsheet", fields))
+            return FakeRequest({"sheets": [
+                {"properties": {"title": title, "gridProperties": {"rowCount": len(rows) + 10}}}
+                for title, rows in self.sheets.items()
+            ]})
+        self.calls.append(("get", range))
+        return FakeRequest(self._range(range))
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        self.calls.append(("batchGet", list(ranges)))
+        return FakeRequest({"valueRanges": [self._range(range_name) for range_name in ranges]})
+
+    def _range(self, range_name):
+        title, rows = range_name.rsplit("!", 1)
+        first, last = (int(row) for row in re.findall(r"\d+", rows))
+        values = self.sheets[title.strip("'")][first - 1:last]
+        while values and not values[-1]:
+            values.pop()
+        return {"range": range_name, "values": values} if values else {"range": range_name}
+
+
+rows = [["date", "amount"]] + [[f"2019-01-{day:02}", str(day)] for day in range(1, 26)]
+
+
+def test_get_many_ranges_batches_requests_and_keeps_order():
+    service = FakeService({"Sales": rows})
+    ranges = [f"Sales!{row}:{row}" for row in range(10, 0, -1)]
+    result = get_many_ranges(service, "id", ranges, batch_size=4)
+    assert [call[0] for call in service.calls] == ["batchGet"] * 3
+    assert list(result) == ranges
+    assert result["Sales!1:1"] == [["date", "amount"]]
+    assert result["Sales!3:3"] == [["2019-01-02", "2"]]
+
+
+def test_iter_sheet_rows_streams_blocks():
+    sheet = rows[:5] + [[]] * 7 + rows[5:]
+    service = FakeService({"Sales": sheet})
+    blocks = list(iter_sheet_rows(service, "id", "Sales", block_size=5))
+    # the empty block in the middle is skipped, not treated as the end of the sheet
+    assert [row for block in blocks for row in block if row] == rows
+    assert max(len(block) for block in blocks) == 5
+    assert ("get", "'Sales'!1:5") in service.calls
+
+
+def test_iter_sheet_rows_unknown_sheet():
+    with pytest.raises(KeyError):
+        next(iter_sheet_rows(FakeService({"Sales": rows}), "id", "Costs"))
+
+
+def test_dataframes_with_header_and_inferred_types():
+    pd = pytest.importorskip("pandas")
+    service = FakeService({"Sales": rows + [["2019-01-26"]]})
+    df = get_many_ranges(service, "id", ["Sales!1:100"], as_df=True, header=True, infer_types=True)["Sales!1:100"]
+    assert list(df.columns) == ["date", "amount"]
+    assert pd.api.types.is_datetime64_any_dtype(df["date"])
+    assert pd.api.types.is_numeric_dtype(df["amount"])
+    assert df["amount"].isna().sum() == 1
+
+    blocks = list(iter_sheet_rows(service, "id", "Sales", block_size=10, as_df=True, header=True))
+    assert all(list(block.columns) == ["date", "amount"] for block in blocks)
+    assert sum(len(block) for block in blocks) == 26
+
+
+def test_dataframe_with_blank_duplicate_headers_and_extra_cells():
+    pd = pytest.importorskip("pandas")
+    values = [["a", "", ""], ["1", "2019-01-01", "x"], ["2", "2019-01-02", "y", "extra"]]
+    df = df_from_result(values, header=True, infer_types=True)
+    assert list(df.columns) == ["a", "", "", "column_4"]
+    assert pd.api.types.is_numeric_dtype(df.iloc[:, 0])
+    assert pd.api.types.is_datetime64_any_dtype(df.iloc[:, 1])
+    assert list(df.iloc[:, 2]) == ["x", "y"]
+    assert list(df["column_4"]) == ["", "extra"]
+
+
+def test_services_are_cached_per_thread(monkeypatch):
+    monkeypatch.setattr(sheets, "_authorize", lambda token_json_filename: None)
+    monkeypatch.setattr(sheets, "build", lambda api, version, http: object(), raising=False)
+    monkeypatch.setattr(sheets, "_services", threading.local())
+    service = make_sheets_api_service("token.json")
+    assert make_sheets_api_service("token.json") is service
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(make_sheets_api_service("token.json")))
+    thread.start()
+    thread.join()
+    assert other[0] is not service
@@ -0,0 +1,58 @@
+from ..sheets_cache import SheetsCache
+from .test_sheets import FakeRequest, FakeService, rows
+
+
+class FakeDrive:
+    def __init__(self, version=1):
+        self.version = version
+        self.calls = 0
+
+    def files(self):
+        return self
+
+    def get(self, fileId, fields):
+        self.calls += 1
+        return FakeRequest({"version": str(self.version)})
+
+
+ranges = ["Sales!1:5", "Sales!6:10"]
+
+
+def test_sheets_cache_uses_ttl_then_revision(tmp_path):
+    service, drive = FakeService({"Sales": rows}), FakeDrive()
+    cache = SheetsCache(str(tmp_path / "cache.sqlite3"), ttl=60, drive_service=drive)
+    first = cache.get_many_ranges(service, "id", ranges)
+    assert first["Sales!1:5"] == rows[:5]
+    assert len(service.calls) == 1 and drive.calls == 1
+
+    # within ttl nothing is requested
+    assert cache.get_many_ranges(service, "id", ranges) == first
+    assert len(service.calls) == 1 and drive.calls == 1
+
+    # ttl expired, same version: only the version is requested
+    cache.ttl = 0
+    assert cache.get_data(service, "id", "Sales!1:5") == rows[:5]
+    assert len(service.calls) == 1 and drive.calls == 2
+
+    # changed version: downloaded again, only the requested range
+    drive.version = 2
+    service.sheets["Sales"] = [["changed"]] + rows[1:]
+    assert cache.get_data(service, "id", "Sales!1:5")[0] == ["changed"]
+    assert service.calls[-1] == ("batchGet", ["Sales!1:5"])
+
+
+def test_sheets_cache_is_shared_through_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    service = FakeService({"Sales": rows})
+    SheetsCache(path, drive_service=FakeDrive()).get_many_ranges(service, "id", ranges)
+    assert SheetsCache(path, drive_service=FakeDrive()).get_many_ranges(service, "id", ranges + ["Sales!40:50"]) \
+        == {"Sales!1:5": rows[:5], "Sales!6:10": rows[5:10], "Sales!40:50": None}
+    assert service.calls == [("batchGet", ranges), ("batchGet", ["Sales!40:50"])]
+
+
+def test_sheets_cache_without_revision_refetches_after_ttl(tmp_path):
+    service = FakeService({"Sales": rows})
+    cache = SheetsCache(str(tmp_path / "cache.sqlite3"), ttl=0)
+    cache.get_data(service, "id", "Sales!1:5")
+    cache.get_data(service, "id", "Sales!1:5")
+    assert len(service.calls) == 2
@@ -1,65 +1,497 @@
+import asyncio
+import contextlib
+import contextvars
 import functools
+import inspect
+import io
+import itertools
+import json
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict
 
 try:
     # pip install sqlalchemy
-    from sqlalchemy import create_engine, MetaData
-    from sqlalchemy.exc import OperationalError
+    from sqlalchemy import create_engine, event, func, MetaData, select, tuple_, ARRAY, JSON
+    from sqlalchemy.dialects import postgresql, sqlite
+    from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
     from sqlalchemy.ext.declarative import declared_attr, declarative_base
+    from sqlalchemy.pool import QueuePool
 
     from sqlalchemy.orm import scoped_session, sessionmaker
 except ModuleNotFoundError:
     pass
 
+try:
+    from ..generaltools.blaster_logger import logger
+except ImportError:
+    # Copied out of blasterutils
+    logger = logging.getLogger(__name__)
+
+# 'UserModel.find_by_id' while a create_session method runs, reported by QueryStats
+_model_method = contextvars.ContextVar('model_method', default=None)
+
+
+def _check_not_read_only(self):
+    # Works for both instance methods and classmethods
+    cls = self if isinstance(self, type) else type(self)
+    if cls.__readonly__:
+        raise TypeError(f"{cls.__name__}.__readonly__ is True, no editing allowed.")
+
 
 def not_read_only(func):
+    if inspect.iscoroutinefunction(func):
+        # Keep coroutine functions async, the check then runs when the coroutine is awaited
+        @functools.wraps(func)
+        async def async_wrapped(self, *args, **kwargs):
+            _check_not_read_only(self)
+            return await func(self, *args, **kwargs)
+
+        return async_wrapped
+
     @functools.wraps(func)
     def wrapped(self, *args, **kwargs):
-        if type(self).__readonly__:
-            raise TypeError(f"{type(self).__name__}.__readonly__ is True, no editing allowed.")
+        _check_not_read_only(self)
         return func(self, *args, **kwargs)
 
     return wrapped
 
 
+def _batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class ModelCache:
+    """
+    Thread-safe LRU cache with TTL for model objects by id, see ModelBase.__cache__.
+
+    Invalidation callbacks registered with on_invalidate are called with the invalidated ids (None after clear()),
+    e.g. to publish them to other processes, which call invalidate(*ids, notify=False) on their own caches.
+
+    Usage:
+
+    >>> class UserModel(Model):
+    ...     __cache__ = ModelCache(maxsize=10000, ttl=300)
+    >>> UserModel.__cache__.on_invalidate(lambda ids: redis.publish('user-invalidate', json.dumps(ids)))
+
+    :param maxsize: max number of cached objects, least recently used ones are evicted first
+    :param ttl: seconds an object stays cached, None to keep it until evicted or invalidated
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # id -> (expires_at, object)
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def get_many(self, ids):
+        """
+        :return: {id: object} for cached ids, missing and expired ones are left out
+        """
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for id_ in ids:
+                entry = self._data.get(id_)
+                if entry is not None and (entry[0] is None or entry[0] > now):
+                    self._data.move_to_end(id_)
+                    found[id_] = entry[1]
+                elif entry is not None:
+                    del self._data[id_]
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def set_many(self, objects):
+        """
+        :param objects: {id: object}
+        """
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            for id_, obj in objects.items():
+                self._data[id_] = (expires_at, obj)
+                self._data.move_to_end(id_)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *ids, notify=True):
+        with self._lock:
+            for id_ in ids:
+                self._data.pop(id_, None)
+        if notify:
+            self._notify(list(ids))
+
+    def clear(self, notify=True):
+        with self._lock:
+            self._data.clear()
+        if notify:
+            self._notify(None)
+
+    def on_invalidate(self, callback):
+        """
+        :param callback: callable(ids), ids is a list or None if the whole cache was cleared
+        """
+        self._callbacks.append(callback)
+        return callback
+
+    def _notify(self, ids):
+        for callback in self._callbacks:
+            try:
+                callback(ids)
+            except Exception as e:
+                logging.error(f'Cache invalidation callback {callback} failed: {e}')
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PoolStats:
+    """
+    Connection pool counters, collected with pool events (checkout, checkin, connect, invalidate) and
+    InstrumentedQueuePool (time spent getting a connection from the pool).
+
+    waits counts checkouts which found no idle connection and no free overflow slot, so they had to wait for
+    a connection to be returned. Many waits or a high checkout_time_max mean pool_size + max_overflow is too small,
+    max_overflow_used far below max_overflow means it can be lowered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.waits = 0
+            self.timeouts = 0
+            self.max_checked_out = 0
+            self.max_overflow_used = 0
+            self.checkout_time_total = 0.0
+            self.checkout_time_max = 0.0
+
+    def listen(self, engine):
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+        self._engine = engine
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        pool = self._engine.pool
+        with self._lock:
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, pool.checkedout())
+            self.max_overflow_used = max(self.max_overflow_used, pool.overflow())
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_checkout_time(self, duration, waited=False, timed_out=False):
+        with self._lock:
+            self.checkout_time_total += duration
+            self.checkout_time_max = max(self.checkout_time_max, duration)
+            self.waits += waited
+            self.timeouts += timed_out
+
+    def snapshot(self, pool=None):
+        """
+        :param pool: QueuePool to add current size, checked in/out and overflow of
+        :return: dict of counters
+        """
+        with self._lock:
+            gets = self.checkouts + self.timeouts
+            stats = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'max_checked_out': self.max_checked_out,
+                'max_overflow_used': self.max_overflow_used,
+                'checkout_time_avg': self.checkout_time_total / gets if gets else 0.0,
+                'checkout_time_max': self.checkout_time_max,
+            }
+        if pool is not None:
+            stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                         overflow=pool.overflow())
+        return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool which reports time spent getting a connection, and whether it had to wait, to self.stats (PoolStats).
+    """
+    stats = None
+
+    def _do_get(self):
+        if self.stats is None:
+            return super()._do_get()
+        waited = self.checkedin() == 0 and -1 < self._max_overflow <= self.overflow()
+        start_time = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record_checkout_time(time.perf_counter() - start_time, waited, timed_out=True)
+            raise
+        self.stats.record_checkout_time(time.perf_counter() - start_time, waited)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
 def make_sqlalchemy_engine(conn_params: dict):
     """
     Connection params with following keys: db_host, db_port, db_user, db_pwd, db_name.
+    db_url may be given instead, as a complete SQLAlchemy URL.
+
+    Optional keys: pool_size (30), max_overflow (50), pool_timeout (30 s), pool_recycle (1800 s, connections older
+    than that are replaced), pool_pre_ping (True, checks connections before use), statement_timeout (ms,
+    PostgreSQL only, no limit by default) and slow_query_threshold (1 s, None to disable the slow query log).
+
+    Pool counters are kept in engine.pool_stats (PoolStats), statement statistics in engine.query_stats (QueryStats).
 
     :param conn_params:
     :return:
     """
-    connection_string = f"postgresql+psycopg2://{conn_params['db_user']}:" \
+    connection_string = conn_params.get('db_url') or f"postgresql+psycopg2://{conn_params['db_user']}:" \
         f"{conn_params['db_pwd']}@{conn_params['db_host']}:{conn_params['db_port']}/{conn_params['db_name']}"
+    connect_args = {}
+    if conn_params.get('statement_timeout'):
+        connect_args['options'] = f"-c statement_timeout={int(conn_params['statement_timeout'])}"
     engine = create_engine(
         connection_string,
-        pool_size=30,
-        max_overflow=50
+        poolclass=InstrumentedQueuePool,
+        pool_size=conn_params.get('pool_size', 30),
+        max_overflow=conn_params.get('max_overflow', 50),
+        pool_timeout=conn_params.get('pool_timeout', 30),
+        pool_recycle=conn_params.get('pool_recycle', 1800),
+        pool_pre_ping=conn_params.get('pool_pre_ping', True),
+        connect_args=connect_args,
     )
     del connection_string
+    engine.pool_stats = PoolStats()
+    engine.pool.stats = engine.pool_stats
+    engine.pool_stats.listen(engine)
+    engine.query_stats = QueryStats(slow_threshold=conn_params.get('slow_query_threshold', 1.0))
+    engine.query_stats.listen(engine)
     return engine
 
 
-db = make_sqlalchemy_engine(YOUR_CONFIG_DICT)
-Session = scoped_session(sessionmaker(db))
+Session = scoped_session(sessionmaker())
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Creates the engine from YOUR_CONFIG_DICT on first use, so importing this module doesn't touch the database.
+
+    :return: Engine
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = make_sqlalchemy_engine(YOUR_CONFIG_DICT)
+                Session.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+
+def get_pool_stats():
+    """
+    :return: PoolStats.snapshot() of the engine, {} if it wasn't created yet
+    """
+    if _engine is None:
+        return {}
+    return _engine.pool_stats.snapshot(_engine.pool)
+
+
+class QueryStats:
+    """
+    Per statement statistics, collected with before/after_cursor_execute events. Statements are grouped by
+    fingerprint: literals and bound parameters replaced with '?' and IN / VALUES lists collapsed, so
+    'WHERE id IN (1, 2, 3)' and 'WHERE id IN (4, 5)' are counted together.
+
+    Statements slower than slow_threshold are logged with the model method which ran them (see create_session).
+
+    Usage:
+
+    >>> print(get_engine().query_stats.report(n=10, key='total_time'))
+
+    :param slow_threshold: seconds, None to disable the slow query log
+    :param max_fingerprints: statements beyond this many distinct fingerprints are counted under '<other>'
+    """
+
+    def __init__(self, slow_threshold=1.0, max_fingerprints=1000):
+        self.slow_threshold = slow_threshold
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def listen(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start_time'].pop()
+        self.record(statement, duration, cursor.rowcount)
+
+    def _handle_error(self, exception_context):
+        start_times = exception_context.connection.info.get('query_start_time') \
+            if exception_context.connection is not None else None
+        if start_times and exception_context.statement is not None:
+            self.record(exception_context.statement, time.perf_counter() - start_times.pop(), error=True)
+
+    def record(self, statement, duration, rows=-1, error=False):
+        method = _model_method.get()
+        fingerprint = statement_fingerprint(statement)
+        with self._lock:
+            stats = self._stats.get(fingerprint)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    fingerprint = '<other>'
+                    stats = self._stats.get(fingerprint)
+                if stats is None:
+                    stats = self._stats[fingerprint] = {
+                        'count': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0, 'rows': 0, 'methods': {},
+                    }
+            stats['count'] += 1
+            stats['errors'] += error
+            stats['total_time'] += duration
+            stats['max_time'] = max(stats['max_time'], duration)
+            stats['rows'] += max(rows, 0)
+            stats['methods'][method] = stats['methods'].get(method, 0) + 1
+
+        if self.slow_threshold is not None and duration >= self.slow_threshold:
+            logger.warning(f'Slow query {duration:.3f}s in {method or "unknown caller"}: '
+                           f'{" ".join(statement.split())[:1000]}')
+
+    def top(self, n=10, key='total_time'):
+        """
+        :param n: number of fingerprints
+        :param key: 'total_time', 'max_time', 'count', 'rows', 'errors' or 'avg_time'
+        :return: list of dicts with fingerprint, count, errors, total_time, avg_time, max_time, rows and methods,
+            sorted by key descending
+        """
+        with self._lock:
+            rows = [
+                dict(stats, fingerprint=fingerprint, methods=dict(stats['methods']),
+                     avg_time=stats['total_time'] / stats['count'])
+                for fingerprint, stats in self._stats.items()
+            ]
+        return sorted(rows, key=lambda row: row[key], reverse=True)[:n]
+
+    def report(self, n=10, key='total_time'):
+        """
+        :return: top(n, key) as text, one statement per line
+        """
+        lines = [f'Top {n} statements by {key}:']
+        for row in self.top(n, key):
+            lines.append(f"{row['total_time']:.3f}s total, {row['avg_time'] * 1000:.1f}ms avg, "
+                         f"{row['max_time'] * 1000:.1f}ms max, {row['count']} calls, {row['errors']} errors, "
+                         f"{row['rows']} rows [{', '.join(str(m) for m in row['methods'])}]: {row['fingerprint']}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+_FINGERPRINT_SUBSTITUTIONS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s|(?<![:\w]):\w+|\$\d+'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\(\?(?:, \?)+\)'), '(?, ...)'),
+    (re.compile(r'(\([?, .]+\))(?:, \([?, .]+\))+'), r'\1, ...'),
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def statement_fingerprint(statement):
+    """
+    'SELECT * FROM user WHERE id IN (1, 2, 3) AND name = 'x'' -> 'SELECT * FROM user WHERE id IN (?, ...) AND name = ?'
+    """
+    for pattern, replacement in _FINGERPRINT_SUBSTITUTIONS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def get_query_report(n=10, key='total_time'):
+    """
+    :return: QueryStats.report() of the engine, '' if it wasn't created yet
+    """
+    if _engine is None:
+        return ''
+    return _engine.query_stats.report(n, key)
+
+
+def __getattr__(name):
+    # Keeps 'from ... import db' working, the engine is created on first access
+    if name == 'db':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def create_session(func):
     @functools.wraps(func)
     def inner(self, *args, **kwargs):
+        get_engine()
         self.session = Session()
+        method = f'{self.__name__ if isinstance(self, type) else type(self).__name__}.{func.__name__}'
+        token = _model_method.set(method)
         try:
             return func(self, *args, **kwargs)
         except OperationalError as e:
-            logging.warning(f'{e}')
+            logger.warning(f'{method} failed: {type(e).__name__}: {e}')
         except Exception as e:
-            logging.error(f'{e}')
+            logger.error(f'{method} failed: {type(e).__name__}: {e}')
             self.session.rollback()
             raise
+        finally:
+            _model_method.reset(token)
 
     return inner
 
 
+def _table_name(cls):
+    if cls.__name__.find('Model') < 1:
+        raise NameError(f"Illegal class name {cls.__name__}, must be {cls.__name__}Model")
+    return cls.__name__[:cls.__name__.find('Model')].lower()
+
+
 class ModelBase:
     """
     Class name must reflect the corresponding table name and end with 'Model'. For example
@@ -69,16 +501,18 @@ class ModelBase:
 
     @declared_attr
     def __tablename__(cls):
-        if cls.__name__.find('Model') < 1:
-            raise NameError(f"Illegal class name {cls.__name__}, must be {cls.__name__}Model")
-        return cls.__name__[:cls.__name__.find('Model')].lower()
+        return _table_name(cls)
 
     __table_args__: dict
     __readonly__: bool = False
+    # Set to ModelCache() to cache find_by_id and find_many_by_list_of_ids, best suited for __readonly__ models
+    __cache__: ModelCache = None
 
     @classmethod
     @create_session
     def find_by_id(cls, id_):
+        if cls.__cache__ is not None:
+            return cls._find_cached([id_]).get(id_)
         return cls.session.query(cls).get(id_)
 
     @classmethod
@@ -89,15 +523,127 @@ class ModelBase:
             return cls.session.query(cls).all()
         return cls.session.query(cls).count()
 
+    @classmethod
+    def iter_all(cls, batch_size=1000):
+        """
+        Iterates over the whole table without loading it into memory: rows are fetched batch_size at a time with
+        yield_per, from a server-side cursor where the driver supports it (psycopg2).
+
+        Uses its own session, so commits in the scoped session during iteration don't close the cursor. The session
+        holds objects by weak reference only, memory stays flat as long as the caller doesn't keep them.
+
+        Usage:
+
+        >>> for user in UserModel.iter_all(batch_size=5000):
+        ...     process(user)
+
+        :param batch_size: rows per fetch
+        """
+        session = _new_session()
+        try:
+            result = session.query(cls).execution_options(stream_results=True).yield_per(batch_size)
+            yield from result
+        finally:
+            session.close()
+
+    @classmethod
+    def iter_pages(cls, page_size=1000, after=None, query_filter=None):
+        """
+        Keyset pagination ordered by primary key: every page is a separate short query 'WHERE pk > last ORDER BY pk
+        LIMIT page_size', so no cursor or transaction is kept open between pages and pages deep into the table are as
+        fast as the first one (unlike OFFSET).
+
+        Usage:
+
+        >>> for page in UserModel.iter_pages(page_size=1000, query_filter=UserModel.active.is_(True)):
+        ...     process(page)
+
+        :param page_size: rows per page
+        :param after: primary key (tuple for composite keys) to start after, None to start at the beginning
+        :param query_filter: optional extra filter expression
+        :return: generator of lists of objects
+        """
+        pk_cols = list(cls.__table__.primary_key.columns)
+        pk_attrs = [getattr(cls, cls.__mapper__.get_property_by_column(col).key) for col in pk_cols]
+        key = pk_attrs[0] if len(pk_attrs) == 1 else tuple_(*pk_attrs)
+        last = after
+        while True:
+            session = _new_session()
+            try:
+                query = session.query(cls)
+                if query_filter is not None:
+                    query = query.filter(query_filter)
+                if last is not None:
+                    query = query.filter(key > (last if len(pk_attrs) == 1 else tuple_(*last)))
+                page = query.order_by(*pk_attrs).limit(page_size).all()
+            finally:
+                session.close()
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last_obj = page[-1]
+            last = getattr(last_obj, pk_attrs[0].key) if len(pk_attrs) == 1 \
+                else tuple(getattr(last_obj, attr.key) for attr in pk_attrs)
+
     @classmethod
     @create_session
-    def find_many_by_list_of_ids(cls, list_of_ids):
+    def find_many_by_list_of_ids(cls, list_of_ids, chunk_size=500):
+        """
+        :param list_of_ids: ids to find, queried chunk_size at a time so long lists don't make one huge IN (...)
+        :param chunk_size: ids per query
+        :return: found objects in order of list_of_ids, missing ids are skipped
+        """
         if not list_of_ids:
             return None
-        query = cls.session.query(cls).filter(
-            cls.id.in_(list_of_ids)
-        )
-        return query.all()
+        if cls.__cache__ is not None:
+            found = cls._find_cached(list_of_ids, chunk_size)
+        else:
+            found = cls._load_by_ids(dict.fromkeys(list_of_ids), chunk_size)
+        return [found[id_] for id_ in list_of_ids if id_ in found]
+
+    @classmethod
+    def _load_by_ids(cls, ids, chunk_size=500, session=None):
+        session = session or cls.session
+        found = {}
+        for chunk in _batches(ids, chunk_size):
+            query = session.query(cls).filter(
+                cls.id.in_(chunk)
+            )
+            for obj in query:
+                found[obj.id] = obj
+        return found
+
+    @classmethod
+    def _find_cached(cls, ids, chunk_size=500):
+        """
+        Cached objects are kept detached and merged into the current session without a query, so every caller gets
+        its own copy. Only missing ids are loaded, in one batch, in a separate session: objects of the current
+        session may have uncommitted changes and must stay attached to it. Objects already in the current session
+        are returned as they are, like session.get() does.
+        """
+        ids = list(dict.fromkeys(ids))
+        cached = cls.__cache__.get_many(ids)
+        missing = [id_ for id_ in ids if id_ not in cached]
+        if missing:
+            session = _new_session()
+            try:
+                loaded = cls._load_by_ids(missing, chunk_size, session)
+            finally:
+                # Detaches the loaded objects
+                session.close()
+            cls.__cache__.set_many(loaded)
+            cached.update(loaded)
+        found = {}
+        for id_, obj in cached.items():
+            existing = cls.session.identity_map.get(cls.session.identity_key(cls, id_))
+            found[id_] = existing if existing is not None else cls.session.merge(obj, load=False)
+        return found
+
+    def _invalidate_cache(self):
+        if type(self).__cache__ is not None and self.id is not None:
+            type(self).__cache__.invalidate(self.id)
 
     # New save_to_db
     @not_read_only
@@ -118,6 +664,120 @@ class ModelBase:
             logging.critical(f'Save to DB failed: {e}')
             self.session.rollback()
             raise
+        self._invalidate_cache()
+
+    @classmethod
+    @not_read_only
+    @create_session
+    def save_many(cls, objects, batch_size=1000):
+        """
+        Inserts or updates many objects with bulk_save_objects, one commit per batch instead of one per object.
+        Objects are not attached to the session afterwards.
+
+        :param objects: iterable of model instances
+        :param batch_size: objects per batch and transaction
+        :return: number of saved objects
+        """
+        count = 0
+        for batch in _batches(objects, batch_size):
+            cls.session.bulk_save_objects(batch)
+            cls.session.commit()
+            if cls.__cache__ is not None:
+                cls.__cache__.invalidate(*(obj.id for obj in batch if obj.id is not None))
+            count += len(batch)
+            logging.debug(f'{cls.__name__}: saved {count} objects')
+        return count
+
+    @classmethod
+    @not_read_only
+    @create_session
+    def upsert_many(cls, rows, conflict_cols=None, update_cols=None, batch_size=1000, use_copy=False):
+        """
+        Inserts rows, updating the existing ones on conflict, with one INSERT ... ON CONFLICT statement and one
+        commit per batch. Works on PostgreSQL and SQLite, other databases fall back to session.merge per row.
+
+        With use_copy=True on PostgreSQL (psycopg2) every batch is loaded with COPY FROM STDIN into a temporary
+        table and upserted from it, which is the fastest way to load a lot of rows.
+
+        Rows with the same conflict_cols in one batch are applied like one statement per row would: the last one
+        wins, the first one with update_cols=[].
+
+        :param rows: iterable of dicts {column name: value}, all with the same keys
+        :param conflict_cols: columns of a unique constraint, primary key by default
+        :param update_cols: columns to update on conflict, all other columns of the row by default, [] to do nothing
+        :param batch_size: rows per batch and transaction
+        :param use_copy: True to use COPY FROM STDIN on PostgreSQL
+        :return: number of processed rows
+        """
+        table = cls.__table__
+        conflict_cols = list(conflict_cols or [column.name for column in table.primary_key.columns])
+        dialect = cls.session.get_bind().dialect.name
+        count = 0
+        for batch in _batches(rows, batch_size):
+            count += len(batch)
+            columns = list(batch[0].keys())
+            cols_to_update = [col for col in columns if col not in conflict_cols] if update_cols is None \
+                else list(update_cols)
+            if all(col in columns for col in conflict_cols):
+                batch = _dedupe(batch, conflict_cols, keep_last=bool(cols_to_update))
+
+            if use_copy and dialect == 'postgresql':
+                cls._copy_upsert(batch, columns, conflict_cols, cols_to_update)
+            elif dialect in ('postgresql', 'sqlite'):
+                insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+                stmt = insert(table)
+                if cols_to_update:
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=conflict_cols,
+                        set_={col: stmt.excluded[col] for col in cols_to_update},
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=conflict_cols)
+                cls.session.execute(stmt, batch)
+            else:
+                for row in batch:
+                    cls.session.merge(cls(**row))
+            cls.session.commit()
+            if cls.__cache__ is not None:
+                if all('id' in row for row in batch):
+                    cls.__cache__.invalidate(*(row['id'] for row in batch))
+                else:
+                    cls.__cache__.clear()
+            logging.debug(f'{cls.__name__}: upserted {count} rows')
+        return count
+
+    @classmethod
+    def _copy_upsert(cls, batch, columns, conflict_cols, update_cols):
+        connection = cls.session.connection()
+        quote = connection.dialect.identifier_preparer.quote
+        table = connection.dialect.identifier_preparer.format_table(cls.__table__)
+        # Same name for every batch keeps the statements cacheable and their QueryStats fingerprints stable,
+        # the table is dropped by the commit after each batch
+        tmp_table = quote(f'tmp_{cls.__table__.name}_upsert')
+        column_list = ', '.join(quote(col) for col in columns)
+        column_types = [cls.__table__.columns[col].type for col in columns]
+
+        buffer = io.StringIO()
+        for row in batch:
+            buffer.write('\t'.join(_copy_value(row[col], type_) for col, type_ in zip(columns, column_types)))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        connection.exec_driver_sql(f'CREATE TEMP TABLE {tmp_table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f'COPY {tmp_table} ({column_list}) FROM STDIN', buffer)
+        finally:
+            cursor.close()
+
+        if update_cols:
+            on_conflict = 'DO UPDATE SET ' + ', '.join(f'{quote(col)} = EXCLUDED.{quote(col)}' for col in update_cols)
+        else:
+            on_conflict = 'DO NOTHING'
+        connection.exec_driver_sql(
+            f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {tmp_table} '
+            f'ON CONFLICT ({", ".join(quote(col) for col in conflict_cols)}) {on_conflict}'
+        )
 
     @not_read_only
     @create_session
@@ -127,6 +787,7 @@ class ModelBase:
             self.session = existing_session
         self.session.delete(self)
         self.session.commit()
+        self._invalidate_cache()
 
     def __eq__(self, other):
         if not type(self) == type(other):
@@ -135,16 +796,276 @@ class ModelBase:
             return False
         return self.id == other.id
 
+    def __hash__(self):
+        # Same as __eq__: by type and id, objects without id are only equal to themselves
+        if not self.id:
+            return object.__hash__(self)
+        return hash((type(self), self.id))
+
     def __repr__(self):
         return f"{type(self).__name__}(id={self.id if self.id else 'None'})"
 
 
-def _make_sql_alchemy_base(my_engine=None):
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _dedupe(rows, key_cols, keep_last=True):
+    """
+    One statement can't update the same row twice on PostgreSQL, duplicates are dropped before.
+    """
+    unique = {}
+    for row in rows:
+        key = tuple(row[col] for col in key_cols)
+        if keep_last or key not in unique:
+            unique[key] = row
+    return list(unique.values())
+
+
+def _copy_value(value, column_type=None):
+    """
+    Value in COPY text format: NULL is \\N, backslashes, tabs and newlines are escaped. Bytes are written in bytea hex
+    format, values of JSON columns are serialized to JSON, lists of ARRAY columns to array literals, other dicts and
+    lists are rejected.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea hex format
+        return '\\\\x' + bytes(value).hex()
+    if isinstance(column_type, JSON):
+        text = json.dumps(value)
+    elif isinstance(column_type, ARRAY) and isinstance(value, (list, tuple)):
+        text = _array_literal(value)
+    elif isinstance(value, (dict, list, tuple, set)):
+        raise TypeError(f"Can't COPY {type(value).__name__} into a {column_type} column")
+    else:
+        text = str(value)
+    return text.translate(_COPY_ESCAPES)
+
+
+def _array_literal(values):
+    """
+    PostgreSQL array literal: [1, None, 'a "b"'] -> '{"1",NULL,"a \\"b\\""}'
+    """
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append('NULL')
+        elif isinstance(value, (list, tuple)):
+            elements.append(_array_literal(value))
+        else:
+            text = json.dumps(value) if isinstance(value, dict) else str(value)
+            elements.append('"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(elements) + '}'
+
+
+def _new_session():
+    """
+    Session outside of the scoped Session, for long reads.
+    """
+    get_engine()
+    return Session.session_factory()
+
+
+def _make_sql_alchemy_base(my_engine=None, base_cls=None):
+    base_cls = base_cls or ModelBase
     mymetadata = MetaData()
     if my_engine:
-        return declarative_base(cls=ModelBase, metadata=mymetadata, bind=my_engine)
+        return declarative_base(cls=base_cls, metadata=mymetadata, bind=my_engine)
     else:
-        return declarative_base(cls=ModelBase, metadata=mymetadata)
+        return declarative_base(cls=base_cls, metadata=mymetadata)
+
+
+# Not bound to the engine, sessions get it from Session.configure() in get_engine()
+Model = _make_sql_alchemy_base()
+
+
+def make_async_sqlalchemy_engine(conn_params: dict):
+    """
+    Same as make_sqlalchemy_engine for AsyncModel, with asyncpg. db_async_url may be given instead of the db_* keys.
+    Pool and statement statistics are in engine.sync_engine.pool_stats and engine.sync_engine.query_stats.
+
+    :param conn_params:
+    :return: AsyncEngine
+    """
+    connection_string = conn_params.get('db_async_url') or f"postgresql+asyncpg://{conn_params['db_user']}:" \
+        f"{conn_params['db_pwd']}@{conn_params['db_host']}:{conn_params['db_port']}/{conn_params['db_name']}"
+    connect_args = {}
+    if conn_params.get('statement_timeout'):
+        connect_args['server_settings'] = {'statement_timeout': str(int(conn_params['statement_timeout']))}
+    engine = create_async_engine(
+        connection_string,
+        pool_size=conn_params.get('pool_size', 30),
+        max_overflow=conn_params.get('max_overflow', 50),
+        pool_timeout=conn_params.get('pool_timeout', 30),
+        pool_recycle=conn_params.get('pool_recycle', 1800),
+        pool_pre_ping=conn_params.get('pool_pre_ping', True),
+        connect_args=connect_args,
+    )
+    del connection_string
+    # Events and counters live on the sync engine behind the AsyncEngine
+    sync_engine = engine.sync_engine
+    sync_engine.pool_stats = PoolStats()
+    sync_engine.pool_stats.listen(sync_engine)
+    sync_engine.query_stats = QueryStats(slow_threshold=conn_params.get('slow_query_threshold', 1.0))
+    sync_engine.query_stats.listen(sync_engine)
+    return engine
+
+
+AsyncSessionFactory = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+_async_engine = None
+# (task, session) of the innermost async_session_scope, see async_session_scope
+_async_session = contextvars.ContextVar('async_session', default=(None, None))
+
+
+def get_async_engine():
+    """
+    Creates the async engine from YOUR_CONFIG_DICT on first use.
+
+    :return: AsyncEngine
+    """
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                engine = make_async_sqlalchemy_engine(YOUR_CONFIG_DICT)
+                AsyncSessionFactory.configure(bind=engine)
+                _async_engine = engine
+    return _async_engine
+
+
+@contextlib.asynccontextmanager
+async def async_session_scope():
+    """
+    Opens an AsyncSession for the current task, AsyncModel methods called inside reuse it. A scope opened while
+    another one is active in the same task reuses the outer session. Tasks copy the context of the task which
+    created them, so tasks spawned inside a scope (e.g. asyncio.gather(A.find_by_id(1), B.find_by_id(2))) see the
+    parent's scope too, but an AsyncSession can't be used concurrently: the session is reused only by the task which
+    opened it, other tasks open their own. Concurrent handlers share only the connection pool.
+
+    Usage:
+
+    >>> async with async_session_scope():
+    ...     user = await UserModel.find_by_id(user_id)
+    ...     user.name = name
+    ...     await user.save_to_db()
+    """
+    task = asyncio.current_task()
+    owner, session = _async_session.get()
+    if session is not None and owner is task:
+        yield session
+        return
+    get_async_engine()
+    session = AsyncSessionFactory()
+    token = _async_session.set((task, session))
+    try:
+        yield session
+    finally:
+        _async_session.reset(token)
+        await session.close()
+
+
+def async_create_session(func):
+    """
+    create_session for AsyncModelBase methods: runs func inside async_session_scope(), the session is
+    cls.current_session().
+    """
+    @functools.wraps(func)
+    async def inner(self, *args, **kwargs):
+        method = f'{self.__name__ if isinstance(self, type) else type(self).__name__}.{func.__name__}'
+        token = _model_method.set(method)
+        try:
+            async with async_session_scope() as session:
+                try:
+                    return await func(self, *args, **kwargs)
+                except OperationalError as e:
+                    logger.warning(f'{method} failed: {type(e).__name__}: {e}')
+                except Exception as e:
+                    logger.error(f'{method} failed: {type(e).__name__}: {e}')
+                    await session.rollback()
+                    raise
+        finally:
+            _model_method.reset(token)
+
+    return inner
+
+
+class AsyncModelBase:
+    """
+    ModelBase for asyncio, on sqlalchemy.ext.asyncio. Same naming rule: class UserModel(AsyncModel) is table 'user'.
+    Sessions are task-local, see async_session_scope.
+
+    Objects stay usable after their session is closed (expire_on_commit=False), but relationships must be loaded
+    eagerly, lazy loading doesn't work with asyncio.
+
+    Usage:
+
+    >>> class UserModel(AsyncModel):
+    ...     id = Column(Integer, primary_key=True)
+    >>> user = await UserModel.find_by_id(1)
+    """
+
+    @declared_attr
+    def __tablename__(cls):
+        return _table_name(cls)
+
+    __table_args__: dict
+    __readonly__: bool = False
+
+    @staticmethod
+    def current_session():
+        """
+        :return: AsyncSession of the current task, None outside of async_session_scope
+        """
+        owner, session = _async_session.get()
+        return session if owner is asyncio.current_task() else None
+
+    @classmethod
+    @async_create_session
+    async def find_by_id(cls, id_):
+        return await cls.current_session().get(cls, id_)
+
+    @classmethod
+    @async_create_session
+    async def find_all(cls, count=False):
+        logging.debug(f'{cls.__name__}: finding all')
+        session = cls.current_session()
+        if not count:
+            return (await session.scalars(select(cls))).all()
+        return await session.scalar(select(func.count()).select_from(cls))
+
+    @classmethod
+    @async_create_session
+    async def find_many_by_list_of_ids(cls, list_of_ids, chunk_size=500):
+        """
+        :return: found objects in order of list_of_ids, missing ids are skipped
+        """
+        if not list_of_ids:
+            return None
+        found = {}
+        for chunk in _batches(dict.fromkeys(list_of_ids), chunk_size):
+            for obj in await cls.current_session().scalars(select(cls).where(cls.id.in_(chunk))):
+                found[obj.id] = obj
+        return [found[id_] for id_ in list_of_ids if id_ in found]
+
+    @not_read_only
+    @async_create_session
+    async def save_to_db(self):
+        session = self.current_session()
+        session.add(self)
+        await session.commit()
+        logging.info(f'Saved {self}')
+
+    @not_read_only
+    @async_create_session
+    async def delete_from_db(self):
+        session = self.current_session()
+        await session.delete(self)
+        await session.commit()
+
+    __eq__ = ModelBase.__eq__
+    __hash__ = ModelBase.__hash__
+    __repr__ = ModelBase.__repr__
 
 
-Model = _make_sql_alchemy_base(my_engine=db)
+AsyncModel = _make_sql_alchemy_base(base_cls=AsyncModelBase)
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("aiosqlite")
+from sqlalchemy import Column, Integer, String  # noqa: E402
+
+from .test_bulk import load_sql_base  # noqa: E402
+
+
+@pytest.fixture
+def base(tmp_path):
+    module = load_sql_base(tmp_path, db_async_url=f"sqlite+aiosqlite:///{tmp_path / 'test.sqlite3'}")
+    yield module
+    module.get_engine().dispose()
+
+
+@pytest.fixture
+def users(base):
+    class UserModel(base.AsyncModel):
+        __table_args__ = {}
+        id = Column(Integer, primary_key=True)
+        name = Column(String)
+
+        @classmethod
+        @base.async_create_session
+        async def used_session(cls):
+            session = cls.current_session()
+            # let the other tasks run while this one holds its session
+            await asyncio.sleep(0.01)
+            assert cls.current_session() is session
+            return session
+
+    async def create():
+        async with base.get_async_engine().begin() as connection:
+            await connection.run_sync(base.AsyncModel.metadata.create_all)
+        for i in range(1, 6):
+            await UserModel(id=i, name=str(i)).save_to_db()
+
+    run(base, create())
+    return UserModel
+
+
+def run(base, coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await base.get_async_engine().dispose()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_tasks_get_separate_sessions(base, users):
+    async def main():
+        assert users.current_session() is None
+        async with base.async_session_scope() as outer:
+            first, second = await asyncio.gather(users.used_session(), users.used_session())
+            found = await asyncio.gather(*(users.find_by_id(i) for i in range(1, 6)))
+        return outer, first, second, found
+
+    outer, first, second, found = run(base, main())
+    assert len({id(outer), id(first), id(second)}) == 3
+    assert [user.name for user in found] == ["1", "2", "3", "4", "5"]
+
+
+def test_nested_calls_in_one_task_reuse_session(base, users):
+    async def main():
+        async with base.async_session_scope() as outer:
+            async with base.async_session_scope() as inner:
+                assert inner is outer
+            assert await users.used_session() is outer
+            user = await users.find_by_id(1)
+            assert outer.identity_map.get(outer.identity_key(users, 1)) is user
+        assert users.current_session() is None
+        assert await users.used_session() is not outer
+
+    run(base, main())
+
+
+def test_models_are_hashable(base, users):
+    async def main():
+        return await users.find_by_id(2), await users.find_by_id(2), await users.find_by_id(3)
+
+    first, again, other = run(base, main())
+    assert first is not again and first == again and hash(first) == hash(again)
+    assert len({first, again, other}) == 2
+    new = users(name="new")
+    assert new != users(name="new") and new in {new}
+
+    class ItemModel(base.Model):
+        __table_args__ = {}
+        id = Column(Integer, primary_key=True)
+
+    assert len({ItemModel(id=1), ItemModel(id=1), ItemModel(id=2)}) == 2
+
+
+def test_read_only_async_methods(base, users):
+    class LogModel(base.AsyncModel):
+        __table_args__ = {}
+        __readonly__ = True
+        id = Column(Integer, primary_key=True)
+
+    # creating the coroutine doesn't raise, awaiting it does
+    coroutine = LogModel(id=1).save_to_db()
+    with pytest.raises(TypeError, match="LogModel.__readonly__"):
+        run(base, coroutine)
@@ -0,0 +1,123 @@
+import importlib.util
+import os
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+from sqlalchemy import Column, Integer, LargeBinary, String, UniqueConstraint  # noqa: E402
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB  # noqa: E402
+
+SQL_BASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "blaster-sql-base.py")
+
+
+def load_sql_base(tmp_path, **config):
+    """
+    blaster-sql-base.py is a template to copy into projects, every test loads a fresh copy of it with
+    YOUR_CONFIG_DICT pointing to an SQLite file in tmp_path.
+    """
+    spec = importlib.util.spec_from_file_location("blaster_sql_base", SQL_BASE)
+    module = importlib.util.module_from_spec(spec)
+    module.YOUR_CONFIG_DICT = {"db_url": f"sqlite:///{tmp_path / 'test.sqlite3'}", "pool_size": 5,
+                               "max_overflow": 2, **config}
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def base(tmp_path):
+    module = load_sql_base(tmp_path)
+    yield module
+    module.Session.remove()
+    module.get_engine().dispose()
+
+
+@pytest.fixture
+def models(base):
+    class UserModel(base.Model):
+        __table_args__ = {}
+        id = Column(Integer, primary_key=True)
+        name = Column(String)
+
+    class EmailModel(base.Model):
+        __table_args__ = (UniqueConstraint("address"),)
+        id = Column(Integer, primary_key=True)
+        address = Column(String, nullable=False)
+        owner = Column(String)
+
+    base.Model.metadata.create_all(base.get_engine())
+    return UserModel, EmailModel
+
+
+def names(model):
+    return {obj.id: obj.name for obj in model.find_all()}
+
+
+def test_save_many(models):
+    UserModel, _ = models
+    assert UserModel.save_many([]) == 0
+    assert UserModel.save_many((UserModel(id=i, name=str(i)) for i in range(1, 26)), batch_size=10) == 25
+    assert UserModel.find_all(count=True) == 25
+    assert UserModel.find_by_id(25).name == "25"
+
+
+def test_upsert_many_inserts_and_updates(models):
+    UserModel, _ = models
+    assert UserModel.upsert_many([]) == 0
+    UserModel.upsert_many([{"id": i, "name": "old"} for i in range(1, 6)])
+    assert UserModel.upsert_many(({"id": i, "name": "new"} for i in range(4, 9)), batch_size=2) == 5
+    assert names(UserModel) == {1: "old", 2: "old", 3: "old", 4: "new", 5: "new", 6: "new", 7: "new", 8: "new"}
+
+
+def test_upsert_many_duplicates_in_one_batch(models):
+    UserModel, _ = models
+    rows = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}, {"id": 1, "name": "c"}]
+    assert UserModel.upsert_many(rows) == 3
+    assert names(UserModel) == {1: "c", 2: "b"}
+
+    # do nothing on conflict: the first row wins, like separate statements
+    UserModel.upsert_many([{"id": 3, "name": "first"}, {"id": 3, "name": "second"}, {"id": 1, "name": "x"}],
+                          update_cols=[])
+    assert names(UserModel) == {1: "c", 2: "b", 3: "first"}
+
+
+def test_upsert_many_on_unique_constraint(models):
+    _, EmailModel = models
+    EmailModel.upsert_many([{"address": "a@x", "owner": "a"}, {"address": "b@x", "owner": "b"}],
+                           conflict_cols=["address"])
+    EmailModel.upsert_many([{"address": "a@x", "owner": "new"}], conflict_cols=["address"], update_cols=["owner"])
+    assert {obj.address: obj.owner for obj in EmailModel.find_all()} == {"a@x": "new", "b@x": "b"}
+
+
+def test_upsert_many_invalidates_cache(base, models):
+    UserModel, _ = models
+    UserModel.__cache__ = base.ModelCache()
+    try:
+        UserModel.upsert_many([{"id": 1, "name": "old"}])
+        assert UserModel.find_by_id(1).name == "old"
+        UserModel.upsert_many([{"id": 1, "name": "new"}])
+        assert UserModel.find_by_id(1).name == "new"
+    finally:
+        UserModel.__cache__ = None
+
+
+def test_read_only_model(base):
+    class LogModel(base.Model):
+        __table_args__ = {}
+        __readonly__ = True
+        id = Column(Integer, primary_key=True)
+
+    with pytest.raises(TypeError):
+        LogModel.save_many([])
+    with pytest.raises(TypeError):
+        LogModel.upsert_many([])
+
+
+def test_copy_values(base):
+    assert base._copy_value(None) == "\\N"
+    assert base._copy_value("a\tb\\c\n") == "a\\tb\\\\c\\n"
+    assert base._copy_value(b"\x00\xff", LargeBinary()) == "\\\\x00ff"
+    assert base._copy_value({"a": "x\ty"}, JSONB()) == '{"a": "x\\\\ty"}'
+    assert base._copy_value([1, None, 'a "b"'], ARRAY(String)) == '{"1",NULL,"a \\\\"b\\\\""}'
+    assert base._copy_value([[1, 2], [3, 4]], ARRAY(Integer)) == '{{"1","2"},{"3","4"}}'
+    with pytest.raises(TypeError):
+        base._copy_value({"a": 1}, String())
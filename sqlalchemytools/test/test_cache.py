@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+from sqlalchemy import inspect  # noqa: E402
+
+from .test_bulk import base, models  # noqa: E402,F401
+
+
+@pytest.fixture
+def users(base, models):
+    UserModel, _ = models
+    UserModel.upsert_many([{"id": i, "name": str(i)} for i in range(1, 11)])
+    UserModel.__cache__ = base.ModelCache(maxsize=100, ttl=None)
+    yield UserModel
+    UserModel.__cache__ = None
+
+
+def selects(base):
+    return sum(row["count"] for row in base.get_engine().query_stats.top(100) if row["fingerprint"].startswith("SELECT"))
+
+
+def in_other_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_model_cache_lru_ttl_and_callbacks(base, monkeypatch):
+    cache = base.ModelCache(maxsize=2, ttl=10)
+    invalidated = []
+    cache.on_invalidate(invalidated.append)
+    cache.set_many({1: "a", 2: "b"})
+    assert cache.get_many([1]) == {1: "a"}
+    cache.set_many({3: "c"})
+    assert cache.get_many([1, 2, 3]) == {1: "a", 3: "c"}
+    assert (cache.hits, cache.misses) == (3, 1)
+
+    now = base.time.monotonic()
+    monkeypatch.setattr(base.time, "monotonic", lambda: now + 11)
+    assert cache.get_many([1, 3]) == {} and len(cache) == 0
+
+    cache.invalidate(5)
+    cache.clear()
+    assert invalidated == [[5], None]
+
+
+def test_find_by_id_hits_cache(base, users):
+    first = users.find_by_id(3)
+    queries = selects(base)
+    again = in_other_thread(lambda: users.find_by_id(3))
+    assert again.name == "3" and again is not first
+    assert selects(base) == queries
+    assert users.__cache__.hits == 1
+
+    found = users.find_many_by_list_of_ids([3, 4, 5])
+    assert [user.id for user in found] == [3, 4, 5]
+    assert users.__cache__.misses == 3
+
+
+def test_save_and_delete_invalidate_cache(users):
+    user = users.find_by_id(1)
+    user.name = "changed"
+    user.save_to_db()
+    assert in_other_thread(lambda: users.find_by_id(1).name) == "changed"
+
+    users.find_by_id(2).delete_from_db()
+    assert in_other_thread(lambda: users.find_by_id(2)) is None
+
+
+def test_cache_miss_keeps_callers_object_attached(users):
+    user = users.find_all()[0]
+    user.name = "uncommitted"
+
+    assert users.find_by_id(user.id) is user
+    assert inspect(user).session is not None
+    cached = users.__cache__.get_many([user.id])[user.id]
+    assert cached is not user and cached.name == str(user.id)
+    # other readers don't see the uncommitted change
+    assert in_other_thread(lambda: users.find_by_id(user.id).name) == str(user.id)
+
+    user.save_to_db()
+    assert in_other_thread(lambda: users.find_by_id(user.id).name) == "uncommitted"
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+from sqlalchemy import Column, Integer  # noqa: E402
+
+from .test_bulk import base, models  # noqa: E402,F401
+
+
+@pytest.fixture
+def users(models):
+    UserModel, _ = models
+    ids = list(range(1, 101))
+    random.Random(3).shuffle(ids)
+    UserModel.upsert_many([{"id": id_, "name": str(id_)} for id_ in ids])
+    return UserModel
+
+
+def test_iter_all(users):
+    assert sorted(user.id for user in users.iter_all(batch_size=7)) == list(range(1, 101))
+
+
+@pytest.mark.parametrize("page_size, sizes", [(10, [10] * 10), (30, [30, 30, 30, 10]), (100, [100]), (1000, [100])])
+def test_iter_pages_boundaries(users, page_size, sizes):
+    pages = list(users.iter_pages(page_size=page_size))
+    assert [len(page) for page in pages] == sizes
+    assert [user.id for page in pages for user in page] == list(range(1, 101))
+
+
+def test_iter_pages_after_and_filter(users):
+    pages = list(users.iter_pages(page_size=10, after=75, query_filter=users.id % 2 == 0))
+    assert [[user.id for user in page] for page in pages] == [list(range(76, 96, 2)), [96, 98, 100]]
+    assert list(users.iter_pages(after=100)) == []
+
+
+def test_iter_pages_is_stable_while_rows_change(users):
+    pages = users.iter_pages(page_size=40)
+    seen = [user.id for user in next(pages)]
+    # rows before the current position don't shift the next pages, unlike OFFSET
+    users.upsert_many([{"id": 0, "name": "new"}, {"id": 1000, "name": "new"}])
+    seen += [user.id for page in pages for user in page]
+    assert seen == list(range(1, 101)) + [1000]
+
+
+def test_iter_pages_composite_key(base):
+    class PairModel(base.Model):
+        __table_args__ = {}
+        a = Column(Integer, primary_key=True)
+        b = Column(Integer, primary_key=True)
+
+    base.Model.metadata.create_all(base.get_engine())
+    PairModel.upsert_many([{"a": i % 10, "b": i // 10} for i in range(95)])
+    pages = list(PairModel.iter_pages(page_size=7))
+    keys = [(pair.a, pair.b) for page in pages for pair in page]
+    assert keys == sorted(keys) and len(keys) == 95
+    assert [(pair.a, pair.b) for pair in next(PairModel.iter_pages(page_size=3, after=(4, 8)))] == \
+        [(4, 9), (5, 0), (5, 1)]
+
+
+def test_find_many_keeps_order_across_chunks(users):
+    ids = [99, 5, 1000, 42, 5, 1, 77, 3]
+    found = users.find_many_by_list_of_ids(ids, chunk_size=2)
+    assert [user.id for user in found] == [99, 5, 42, 5, 1, 77, 3]
+    assert [user.id for user in users.find_many_by_list_of_ids(list(range(100, 0, -1)), chunk_size=7)] == \
+        list(range(100, 0, -1))
+    assert users.find_many_by_list_of_ids([]) is None
@@ -0,0 +1,122 @@
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError  # noqa: E402
+
+from .test_bulk import load_sql_base  # noqa: E402
+
+
+@pytest.fixture
+def base(tmp_path):
+    module = load_sql_base(tmp_path, pool_size=1, max_overflow=1, pool_timeout=0.1)
+    yield module
+    module.get_engine().dispose()
+
+
+def test_pool_stats_count_checkouts_and_waits(base):
+    assert base.get_pool_stats() == {}
+    engine = base.get_engine()
+    assert isinstance(engine.pool, base.InstrumentedQueuePool)
+
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    stats = base.get_pool_stats()
+    assert (stats["checkouts"], stats["checkins"], stats["connects"]) == (3, 3, 1)
+    assert (stats["waits"], stats["timeouts"], stats["max_overflow_used"]) == (0, 0, 0)
+    assert (stats["size"], stats["checked_in"], stats["checked_out"]) == (1, 1, 0)
+
+    first, second = engine.connect(), engine.connect()
+    try:
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        stats = base.get_pool_stats()
+        assert (stats["checkouts"], stats["checked_out"], stats["connects"]) == (5, 2, 2)
+        assert (stats["max_checked_out"], stats["max_overflow_used"]) == (2, 1)
+        assert (stats["waits"], stats["timeouts"]) == (1, 1)
+        assert stats["checkout_time_max"] >= 0.1
+    finally:
+        first.close()
+        second.close()
+    assert base.get_pool_stats()["checkins"] == 5
+
+    engine.pool_stats.reset()
+    assert engine.pool_stats.snapshot()["checkouts"] == 0
+
+
+def test_recreated_pool_keeps_stats(base):
+    engine = base.get_engine()
+    engine.dispose()
+    assert engine.pool.stats is engine.pool_stats
+    with engine.connect():
+        pass
+    assert base.get_pool_stats()["checkouts"] == 1
+
+
+def test_statement_fingerprint(base):
+    assert base.statement_fingerprint("SELECT * FROM user WHERE id IN (1, 2, 3) AND name = 'it''s'") == \
+        "SELECT * FROM user WHERE id IN (?, ...) AND name = ?"
+    assert base.statement_fingerprint("INSERT INTO t (a, b)\n VALUES (%(a)s, %(b)s), ($1, $2), (:a, 2.5)") == \
+        "INSERT INTO t (a, b) VALUES (?, ...), ..."
+    assert base.statement_fingerprint("SELECT x1 FROM t2 WHERE y = ?") == "SELECT x1 FROM t2 WHERE y = ?"
+
+
+def test_query_stats_group_statements(tmp_path, caplog):
+    base = load_sql_base(tmp_path, slow_query_threshold=None)
+    try:
+        engine = base.get_engine()
+        stats = engine.query_stats
+        with engine.connect() as connection:
+            connection.execute(text("CREATE TABLE item (id INTEGER PRIMARY KEY, name TEXT)"))
+            connection.execute(text("INSERT INTO item VALUES (1, 'a'), (2, 'b'), (3, 'c')"))
+            connection.execute(text("SELECT * FROM item WHERE id IN (1, 2, 3) AND name != 'x'"))
+            connection.execute(text("SELECT * FROM item WHERE id IN (4, 5) AND name != 'yy'"))
+            with pytest.raises(sqlalchemy.exc.OperationalError):
+                connection.execute(text("SELECT * FROM missing WHERE id = 1"))
+
+        rows = {row["fingerprint"]: row for row in stats.top(n=10, key="count")}
+        select = rows["SELECT * FROM item WHERE id IN (?, ...) AND name != ?"]
+        assert (select["count"], select["errors"], select["methods"]) == (2, 0, {None: 2})
+        assert select["total_time"] >= select["max_time"] > 0
+        assert select["avg_time"] == pytest.approx(select["total_time"] / 2)
+        assert rows["INSERT INTO item VALUES (?, ...), ..."]["rows"] == 3
+        assert rows["SELECT * FROM missing WHERE id = ?"]["errors"] == 1
+        assert "2 calls, 0 errors" in stats.report(n=10, key="count")
+        assert not [record for record in caplog.records if "Slow query" in record.getMessage()]
+
+        stats.reset()
+        assert stats.top() == []
+    finally:
+        base.get_engine().dispose()
+
+
+def test_query_stats_per_model_method_and_slow_log(tmp_path, caplog):
+    base = load_sql_base(tmp_path, slow_query_threshold=0)
+    try:
+        class ItemModel(base.Model):
+            __table_args__ = {}
+            id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+
+        base.Model.metadata.create_all(base.get_engine())
+        ItemModel.upsert_many([{"id": 1}, {"id": 2}])
+        base.get_engine().query_stats.reset()
+        ItemModel.find_by_id(1)
+        ItemModel.find_by_id(2)
+        base.Session.remove()
+
+        (row,) = [row for row in base.get_engine().query_stats.top() if row["fingerprint"].startswith("SELECT")]
+        assert row["count"] == 2 and row["methods"] == {"ItemModel.find_by_id": 2}
+        assert "ItemModel.find_by_id" in base.get_query_report()
+        assert any("Slow query" in record.getMessage() and "ItemModel.find_by_id" in record.getMessage()
+                   for record in caplog.records)
+    finally:
+        base.get_engine().dispose()
+
+
+def test_query_stats_fingerprint_limit(base):
+    stats = base.QueryStats(max_fingerprints=2)
+    for i in range(4):
+        stats.record(f"SELECT * FROM t{chr(97 + i)}", 0.5)
+    assert {row["fingerprint"]: row["count"] for row in stats.top()} == \
+        {"SELECT * FROM ta": 1, "SELECT * FROM tb": 1, "<other>": 2}
@@ -1,4 +1,9 @@
 from .bot_logger import bot_report_exceptions
-from .send_message import send_message
-from .command_dispatcher import command_dispatch
+from .send_message import send_message, broadcast, broadcast_async
+from .rate_limiter import RateLimiter, default_rate_limiter
+from .outbox import Outbox
+from .coalescer import MessageCoalescer
+from .command_dispatcher import command_dispatch, parse_command
+from .chat_executor import ChatExecutor, AsyncChatExecutor
 from . import custom_filters
+from .custom_filters import FilterSet
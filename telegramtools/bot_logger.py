@@ -1,5 +1,10 @@
+import atexit
+import inspect
 import logging
 import os
+import queue
+import threading
+import time
 from functools import wraps
 
 try:
@@ -7,25 +12,150 @@ try:
 except ModuleNotFoundError:
     pass
 
+SUMMARY_INTERVAL = 60
+
+
+class ExceptionReporter:
+    """
+    Sends exception reports to a telegram chat from a background thread, so the failing call doesn't wait for
+    Telegram.
+
+    The first exception of a kind (function + exception type) is reported at once, the same ones during the next
+    summary_interval seconds are only counted and reported as one summary afterwards. A crash loop therefore sends
+    at most one message per kind per summary_interval.
+
+    :param bot: telegram.Bot
+    :param chat_id: chat to report to
+    :param summary_interval: seconds between two reports of the same kind
+    :param max_queue_size: reports waiting to be sent, new ones are dropped when the queue is full
+    """
+
+    def __init__(self, bot, chat_id, summary_interval=SUMMARY_INTERVAL, max_queue_size=1000):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.summary_interval = summary_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._last_reported = {}
+        self._suppressed = {}  # kind -> [count, last message]
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="exception-reporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def report(self, func, exception):
+        kind = (f"{func.__module__}.{func.__qualname__}", type(exception).__name__)
+        message = f"Error in: {func.__name__} [{func.__module__}]\n{exception}"
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_reported.get(kind, -self.summary_interval) < self.summary_interval:
+                suppressed = self._suppressed.setdefault(kind, [0, None])
+                suppressed[0] += 1
+                suppressed[1] = message
+                return
+            self._last_reported[kind] = now
+            count, _ = self._suppressed.pop(kind, (0, None))
+        if count:
+            message += f"\n(+{count} similar since last report)"
+        self._put(message)
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            logging.warning(f"Exception report queue is full, dropped: {message}")
+
+    def _summaries(self, everything=False):
+        messages = []
+        with self._lock:
+            now = time.monotonic()
+            for kind, (count, last_message) in list(self._suppressed.items()):
+                if everything or now - self._last_reported[kind] >= self.summary_interval:
+                    del self._suppressed[kind]
+                    self._last_reported[kind] = now
+                    messages.append(f"{last_message}\n(happened {count} times in the last "
+                                    f"{self.summary_interval}s)")
+        return messages
+
+    def _send(self, message):
+        try:
+            self.bot.send_message(self.chat_id, message)
+        except TelegramError as e:
+            logging.critical(f'Failed to send message to {self.chat_id}: {e}')
+        except Exception as e:
+            logging.critical(f'Failed to report exception to {self.chat_id}: {e}')
+
+    def _run(self):
+        while True:
+            try:
+                message = self._queue.get(timeout=self.summary_interval / 2)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                self._send(message)
+            for summary in self._summaries():
+                self._send(summary)
+
+    def close(self):
+        """
+        Sends queued reports and pending summaries in the calling thread. Called at exit.
+        """
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is not None:
+                self._send(message)
+        for summary in self._summaries(everything=True):
+            self._send(summary)
+
+
+_reporter = None
+_reporter_lock = threading.Lock()
+
+
+def get_reporter():
+    """
+    :return: ExceptionReporter for BOT_TOKEN_REPORTER and REPORT_TO_TELEGRAM_ID, created once per process
+    """
+    global _reporter
+    if _reporter is None:
+        with _reporter_lock:
+            if _reporter is None:
+                if not os.environ.get('BOT_TOKEN_REPORTER'):
+                    raise KeyError('No bot token in os environment variables under "BOT_TOKEN_REPORTER"')
+                if not os.environ.get('REPORT_TO_TELEGRAM_ID'):
+                    raise KeyError('No telegram id to report to in os environment variables under '
+                                   '"REPORT_TO_TELEGRAM_ID"')
+                _reporter = ExceptionReporter(Bot(os.environ['BOT_TOKEN_REPORTER']),
+                                              os.environ['REPORT_TO_TELEGRAM_ID'])
+    return _reporter
+
 
 def bot_report_exceptions(func):
+    """
+    Reports all unhandled exceptions of func (sync or async) to REPORT_TO_TELEGRAM_ID via BOT_TOKEN_REPORTER bot and
+    re-raises them. Reports are sent in background and rate-limited, see ExceptionReporter.
+    """
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            reporter = get_reporter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                reporter.report(func, e)
+                raise
+
+        return wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        if not os.environ.get('BOT_TOKEN_REPORTER'):
-            raise KeyError('No bot token in os environment variables under "BOT_TOKEN_REPORTER"')
-        if not os.environ.get('REPORT_TO_TELEGRAM_ID'):
-            raise KeyError('No telegram id to report to in os environment variables under "REPORT_TO_TELEGRAM_ID"')
-
-        reporter_bot = Bot(os.environ['BOT_TOKEN_REPORTER'])
-        report_to_telegram_id = os.environ['REPORT_TO_TELEGRAM_ID']
+        reporter = get_reporter()
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            log_message = f"Error in: {func.__name__} [{func.__module__}]\n{e}"
-            try:
-                reporter_bot.send_message(report_to_telegram_id, log_message)
-            except TelegramError as e:
-                logging.critical(f'Failed to send message to {report_to_telegram_id}: {e}')
+            reporter.report(func, e)
             raise
 
     return wrapper
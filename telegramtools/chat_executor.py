@@ -0,0 +1,219 @@
+import asyncio
+import inspect
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from ..generaltools.blaster_timing import timing_registry
+
+
+class ChatExecutor:
+    """
+    Thread pool which runs updates of different chats in parallel and updates of the same chat strictly one after
+    another, in order of submission.
+
+    Each chat with pending updates has its own queue, a worker takes the chat, runs its oldest update and puts the
+    chat back to the ready queue if more updates are pending, so a slow handler only holds back its own chat.
+    Number of pending updates is bounded by max_pending, submit() blocks (up to timeout, then raises queue.Full)
+    when the limit is reached.
+
+    Queue wait and run time are recorded in timing_registry under "<name>.wait" and "<name>.run".
+
+    Usage:
+
+    >>> executor = ChatExecutor(max_workers=8)
+    >>> dispatcher.add_handler(MessageHandler(Filters.command, executor.wrap(handle_command)))
+
+    :param max_workers: number of worker threads
+    :param max_pending: max number of submitted but not finished updates
+    :param timeout: seconds submit() waits for a free slot, None to wait forever
+    :param name: thread name and timing_registry prefix
+    """
+
+    def __init__(self, max_workers=8, max_pending=1000, timeout=None, name="chat-executor"):
+        self.name = name
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._chats = {}  # chat_id -> deque of pending updates, present while a chat has pending or running ones
+        self._ready = deque()
+        self._condition = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._running = 0
+        self._closed = False
+        self._wait_timings = timing_registry.get(f"{name}.wait")
+        self._run_timings = timing_registry.get(f"{name}.run")
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True) for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, chat_id, fn, *args, **kwargs):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise queue.Full(f"{self.name}: {self.max_pending} updates pending")
+        with self._condition:
+            if self._closed:
+                self._slots.release()
+                raise RuntimeError(f"{self.name} is shut down")
+            self._pending += 1
+            updates = self._chats.get(chat_id)
+            if updates is None:
+                updates = self._chats[chat_id] = deque()
+                self._ready.append(chat_id)
+                self._condition.notify()
+            updates.append((time.perf_counter(), fn, args, kwargs))
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._ready and not self._closed:
+                    self._condition.wait()
+                if not self._ready:
+                    return
+                chat_id = self._ready.popleft()
+                submitted_at, fn, args, kwargs = self._chats[chat_id][0]
+                self._running += 1
+
+            started_at = time.perf_counter()
+            self._wait_timings.record(started_at - submitted_at)
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                self._run_timings.record(time.perf_counter() - started_at, error=True)
+                logging.error(f"{self.name}: update of chat {chat_id} failed: {e}")
+            else:
+                self._run_timings.record(time.perf_counter() - started_at)
+
+            with self._condition:
+                self._running -= 1
+                self._pending -= 1
+                updates = self._chats[chat_id]
+                updates.popleft()
+                if updates:
+                    self._ready.append(chat_id)
+                    self._condition.notify()
+                else:
+                    del self._chats[chat_id]
+            self._slots.release()
+
+    def wrap(self, handler):
+        """
+        :return: callback(update, context, ...) which submits handler to the executor by update.effective_chat
+        """
+        @wraps(handler)
+        def callback(update, context, *args, **kwargs):
+            self.submit(_chat_id(update), handler, update, context, *args, **kwargs)
+
+        return callback
+
+    def metrics(self):
+        """
+        :return: {"pending": .., "running": .., "chats": .., "wait": {..}, "run": {..}}
+        """
+        with self._condition:
+            depth = {"pending": self._pending, "running": self._running, "chats": len(self._chats)}
+        return dict(depth, wait=self._wait_timings.snapshot(), run=self._run_timings.snapshot())
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting updates, workers exit after all pending ones are done.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class AsyncChatExecutor:
+    """
+    Same as ChatExecutor for asyncio. Every chat with pending updates is drained by its own task, at most
+    max_concurrency handlers run at once. Coroutine handlers are awaited, sync ones run in the default executor.
+    submit() waits while max_pending updates are pending.
+
+    :param max_concurrency: number of handlers running at once
+    :param max_pending: max number of submitted but not finished updates
+    :param name: timing_registry prefix
+    """
+
+    def __init__(self, max_concurrency=100, max_pending=1000, name="async-chat-executor"):
+        self.name = name
+        self._chats = {}
+        self._tasks = set()
+        self._slots = asyncio.Semaphore(max_pending)
+        self._concurrency = asyncio.Semaphore(max_concurrency)
+        self._pending = 0
+        self._running = 0
+        self._wait_timings = timing_registry.get(f"{name}.wait")
+        self._run_timings = timing_registry.get(f"{name}.run")
+
+    async def submit(self, chat_id, fn, *args, **kwargs):
+        await self._slots.acquire()
+        self._pending += 1
+        updates = self._chats.get(chat_id)
+        if updates is None:
+            updates = self._chats[chat_id] = deque()
+            task = asyncio.ensure_future(self._drain(chat_id, updates))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        updates.append((time.perf_counter(), fn, args, kwargs))
+
+    async def _drain(self, chat_id, updates):
+        while updates:
+            submitted_at, fn, args, kwargs = updates[0]
+            async with self._concurrency:
+                self._running += 1
+                started_at = time.perf_counter()
+                self._wait_timings.record(started_at - submitted_at)
+                try:
+                    if inspect.iscoroutinefunction(fn):
+                        await fn(*args, **kwargs)
+                    else:
+                        await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+                except Exception as e:
+                    self._run_timings.record(time.perf_counter() - started_at, error=True)
+                    logging.error(f"{self.name}: update of chat {chat_id} failed: {e}")
+                else:
+                    self._run_timings.record(time.perf_counter() - started_at)
+                finally:
+                    self._running -= 1
+            updates.popleft()
+            self._pending -= 1
+            self._slots.release()
+        del self._chats[chat_id]
+
+    def wrap(self, handler):
+        """
+        :return: async callback(update, context, ...) which submits handler to the executor by update.effective_chat
+        """
+        @wraps(handler)
+        async def callback(update, context, *args, **kwargs):
+            await self.submit(_chat_id(update), handler, update, context, *args, **kwargs)
+
+        return callback
+
+    def metrics(self):
+        return {
+            "pending": self._pending,
+            "running": self._running,
+            "chats": len(self._chats),
+            "wait": self._wait_timings.snapshot(),
+            "run": self._run_timings.snapshot(),
+        }
+
+    async def join(self):
+        """
+        Waits until all submitted updates are done.
+        """
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+
+def _chat_id(update):
+    chat = getattr(update, "effective_chat", None)
+    return chat.id if chat is not None else None
@@ -0,0 +1,180 @@
+import atexit
+import logging
+import threading
+import time
+
+try:
+    # pip install python-telegram-bot
+    from telegram import MAX_MESSAGE_LENGTH
+except ModuleNotFoundError:
+    pass
+
+from .rate_limiter import default_rate_limiter
+from .send_message import _coalescers, _send_split_message, _split_message_by_telegram_requirements
+
+
+class MessageCoalescer:
+    """
+    Buffers small messages to the same chat and parse_mode for up to window seconds and sends them together, packed
+    into as few messages of up to MAX_MESSAGE_LENGTH as possible. Messages are joined with a newline and only
+    messages longer than MAX_MESSAGE_LENGTH are split (see _split_message_by_telegram_requirements).
+
+    Buffers are flushed by a background thread, one chat after another, and at exit. The thread stops when nothing
+    is buffered. send_message without this coalescer (or with reply_markup) first flushes buffers of the same chat
+    and waits for messages to it which are being sent, so messages arrive in order. Other chats don't wait.
+
+    Usage:
+
+    >>> coalescer = MessageCoalescer(bot, window=1)
+    >>> send_message(bot, user_id, "Step 1 done", coalescer=coalescer)
+    >>> send_message(bot, user_id, "Step 2 done", coalescer=coalescer)  # both arrive as one message
+
+    :param bot: telegram.Bot
+    :param window: seconds to wait for more messages after the first buffered one
+    :param rate_limiter: RateLimiter, None to send without limits
+    :param disable_web_page_preview:
+    """
+
+    def __init__(self, bot, window=0.5, rate_limiter=default_rate_limiter, disable_web_page_preview=True):
+        self.bot = bot
+        self.window = window
+        self.rate_limiter = rate_limiter
+        self.disable_web_page_preview = disable_web_page_preview
+        self._buffers = {}  # (chat_id, parse_mode) -> [deadline, [texts]]
+        # chat_id -> number of taken buffers not sent yet, buffers of such chats are not taken until they're sent
+        self._in_flight = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        _coalescers.add(self)
+
+    def add(self, chat_id, text, parse_mode="MARKDOWN"):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("MessageCoalescer is closed")
+            buffer = self._buffers.get((chat_id, parse_mode))
+            if buffer is None:
+                self._buffers[(chat_id, parse_mode)] = [time.monotonic() + self.window, [text]]
+            else:
+                buffer[1].append(text)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-coalescer", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _take(self, everything=False, chat_id=None):
+        """
+        Pops due buffers of chats with nothing in flight and marks them in flight. Called with self._condition.
+        """
+        now = time.monotonic()
+        due = [key for key, (deadline, _) in self._buffers.items()
+               if (everything or deadline <= now) and (chat_id is None or key[0] == chat_id)
+               and key[0] not in self._in_flight]
+        for chat_id_, _ in due:
+            self._in_flight[chat_id_] = self._in_flight.get(chat_id_, 0) + 1
+        return [(key, self._buffers.pop(key)[1]) for key in due]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    closed = self._closed
+                    due = self._take(everything=closed)
+                    if due:
+                        break
+                    if not self._buffers:
+                        # Started again by add()
+                        self._thread = None
+                        return
+                    deadlines = [deadline for (chat_id, _), (deadline, _) in self._buffers.items()
+                                 if chat_id not in self._in_flight]
+                    self._condition.wait(max(min(deadlines) - time.monotonic(), 0) if deadlines else None)
+            self._send(due)
+
+    def _send(self, due):
+        for (chat_id, parse_mode), texts in due:
+            try:
+                _send_split_message(
+                    self.bot,
+                    chat_id,
+                    pack_messages(texts, parse_mode),
+                    parse_mode=parse_mode,
+                    disable_web_page_preview=self.disable_web_page_preview,
+                    rate_limiter=self.rate_limiter,
+                )
+            except Exception as e:
+                logging.error(f"Failed to send coalesced messages to {chat_id}: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight[chat_id] -= 1
+                    if not self._in_flight[chat_id]:
+                        del self._in_flight[chat_id]
+                    self._condition.notify_all()
+
+    def flush(self, chat_id=None):
+        """
+        Sends everything buffered right away, in the calling thread. Returns after messages which were being sent
+        by the background thread are sent too.
+
+        :param chat_id: flush only buffers of this chat
+        """
+        with self._condition:
+            while True:
+                if chat_id is None:
+                    busy = bool(self._in_flight)
+                else:
+                    busy = chat_id in self._in_flight
+                    if not busy and not any(key[0] == chat_id for key in self._buffers):
+                        return
+                if not busy:
+                    break
+                self._condition.wait()
+            due = self._take(everything=True, chat_id=chat_id)
+        self._send(due)
+
+    def close(self, timeout=None):
+        """
+        Flushes buffers and stops the background thread. Called at exit.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+
+@atexit.register
+def _close_all():
+    # Coalescers are only weakly referenced, unused ones can be garbage collected
+    for coalescer in list(_coalescers):
+        coalescer.close()
+
+
+def pack_messages(texts, parse_mode=None, max_length=None):
+    """
+    Joins texts with newlines into as few chunks of up to max_length as possible, without splitting texts which fit
+    into one chunk.
+
+    :return: list of str
+    """
+    max_length = max_length or MAX_MESSAGE_LENGTH
+    chunks = []
+    parts = []
+    length = 0
+    for text in texts:
+        if len(text) > max_length:
+            if parts:
+                chunks.append("\n".join(parts))
+                parts, length = [], 0
+            chunks.extend(_split_message_by_telegram_requirements(text, parse_mode, max_length))
+        elif parts and length + 1 + len(text) > max_length:
+            chunks.append("\n".join(parts))
+            parts, length = [text], len(text)
+        else:
+            length += len(text) + (1 if parts else 0)
+            parts.append(text)
+    if parts:
+        chunks.append("\n".join(parts))
+    return chunks
@@ -1,9 +1,34 @@
 import logging
+import re
+import time
+from collections import namedtuple
 from functools import update_wrapper
 
 from telegram import Update
 from telegram.ext import CallbackContext
 
+from ..generaltools.blaster_timing import timing_registry
+
+ParsedCommand = namedtuple("ParsedCommand", ["command", "target", "args", "mention"])
+
+
+def parse_command(text):
+    """
+    Parses message text in one pass: '/reg_ads324@my_bot arg1 arg2' -> ParsedCommand(command='/reg',
+    target='ads324', args=['arg1', 'arg2'], mention='my_bot'). target and mention are None if absent.
+
+    :param text: message text
+    :return: ParsedCommand
+    """
+    tokens = (text or "").split()
+    if not tokens:
+        return ParsedCommand("", None, [], None)
+    command, _, mention = tokens[0].partition("@")
+    command, underscore, target = command.partition("_")
+    if underscore:
+        target = target.split("_", 1)[0]
+    return ParsedCommand(command, target if underscore else None, tokens[1:], mention or None)
+
 
 def command_dispatch(func):
     """
@@ -14,70 +39,109 @@ def command_dispatch(func):
 
     Will put all args (/command arg1 arg2) into kwargs['args']
 
+    Commands can be registered with aliases (list of commands) and as prefixes:
+    register('/admin', prefix=True) also handles /adminstats, /admin_users etc. Exact matches win over prefixes,
+    longer prefixes win over shorter ones. '/command@botname' is dispatched as '/command' if wrapper.bot_username
+    is None or equal to botname, commands for other bots are ignored.
+
+    Calls and latency of each command are recorded in generaltools.blaster_timing.timing_registry under
+    "<module>.<dispatcher>:<command>".
+
     :param func:
     :return:
     """
     registry = {}
+    prefixes = {}
+    prefix_pattern = None
+    timings_prefix = f"{func.__module__}.{func.__qualname__}:"
 
     def unregistered_command(update: Update, context: CallbackContext, **kwargs):
         return
 
-    def dispatch(command):
-        nonlocal registry
+    def compile_prefixes():
+        nonlocal prefix_pattern
+        if prefixes:
+            # Longest alternative first, so the regex returns the longest matching prefix
+            alternatives = sorted(prefixes, key=len, reverse=True)
+            prefix_pattern = re.compile("|".join(re.escape(prefix) for prefix in alternatives))
+        else:
+            prefix_pattern = None
 
-        real_command = command.split('_')[0]
+    def route(real_command):
+        impl = registry.get(real_command)
+        if impl is None and prefix_pattern is not None:
+            match = prefix_pattern.match(real_command)
+            if match:
+                return match.group(), prefixes[match.group()]
+        return real_command, impl
 
-        try:
-            impl = registry[real_command]
-        except KeyError:
+    def dispatch(command):
+        real_command = parse_command(command).command
+        impl = route(real_command)[1]
+        if impl is None:
             logging.warning(f"Unregistered command: {command}")
             return unregistered_command
-
         return impl
 
-    def save_to_registry(command, func):
+    def save_to_registry(command, func, prefix=False):
         real_command = command.split('_')[0]
+        table = prefixes if prefix else registry
 
-        if real_command in registry.keys():
+        if real_command in table.keys():
             raise KeyError(f'Duplicate command {command} in {func.__module__}.{func.__name__}. '
-                           f'Command already registered in {registry[command].__module__}.{registry[command].__name__}')
-        registry[real_command] = func
-
-    def register(command, func=None):
-        nonlocal registry
+                           f'Command already registered in {table[real_command].__module__}.'
+                           f'{table[real_command].__name__}')
+        table[real_command] = func
+        if prefix:
+            compile_prefixes()
 
+    def register(command, func=None, prefix=False):
         if func is None:
-            return lambda c: register(command, c)
+            return lambda c: register(command, c, prefix=prefix)
 
         if isinstance(command, list):
             for subcommand in command:
-                save_to_registry(subcommand, func)
+                save_to_registry(subcommand, func, prefix)
         elif isinstance(command, str):
-            save_to_registry(command, func)
+            save_to_registry(command, func, prefix)
         else:
             raise ValueError(f"command must be str, or list of str, not {type(command)}")
 
         return func
 
     def wrapper(update: Update, context: CallbackContext, *args, **kwargs):
-        text = update.message.text
-        if len(text.split()) == 1:
-            command = text
-        else:
-            command = text.split()[0]
-            kwargs['args'] = text.split()[1:]
+        parsed = parse_command(update.message.text)
+        if parsed.mention and wrapper.bot_username and parsed.mention.lower() != wrapper.bot_username.lower():
+            return
 
-        if '_' in command:
-            kwargs['target'] = text.split('_')[1]
+        if parsed.args:
+            kwargs['args'] = parsed.args
+        if parsed.target is not None:
+            kwargs['target'] = parsed.target
 
-        logging.info(f'{command} from {update.effective_user.full_name} ({update.effective_user.id})')
+        logging.info(f'{parsed.command} from {update.effective_user.full_name} ({update.effective_user.id})')
 
-        return dispatch(command)(update, context, *args, **kwargs)
+        routed_command, impl = route(parsed.command)
+        if impl is None:
+            logging.warning(f"Unregistered command: {parsed.command}")
+            return unregistered_command(update, context, *args, **kwargs)
+
+        timings = timing_registry.get(timings_prefix + routed_command)
+        start_time = time.perf_counter()
+        try:
+            result = impl(update, context, *args, **kwargs)
+        except Exception:
+            timings.record(time.perf_counter() - start_time, error=True)
+            raise
+        timings.record(time.perf_counter() - start_time)
+        return result
 
     registry[object] = func
     wrapper.register = register
     wrapper.dispatch = dispatch
     wrapper.registry = registry
+    wrapper.prefixes = prefixes
+    wrapper.bot_username = None
     update_wrapper(wrapper, func)
 
     return wrapper
@@ -1,5 +1,160 @@
 import re
 
+
+class FilterSet:
+    """
+    Set of named patterns checked against a message together.
+
+    Literal keywords (literal=True) are compiled into a single trie-shaped regex, scanned once per message with a
+    lookahead, so every keyword is found, including overlapping ones, in one pass like Aho-Corasick.
+    Regex patterns are compiled once and searched one by one, skipping those already known to match: an alternation
+    of general regexes is slower than separate searches in python's re engine, as every alternative is tried at
+    every position.
+
+    Usage:
+
+    >>> filters = FilterSet()
+    >>> filters.add("greeting", r"\\b(hi|hello)\\b", flags=re.IGNORECASE)
+    >>> filters.add("price", "price", literal=True)
+    >>> filters.add("cost", "cost", literal=True, flags=re.IGNORECASE)
+    >>> filters.matches("Hello, what's the price?")
+    {'greeting', 'price'}
+    >>> filters.first_match("Hello, what's the price?")
+    'price'
+    >>> dispatcher.add_handler(MessageHandler(filters.filter("price", "cost"), handle_price))
+    """
+
+    def __init__(self):
+        self._names = set()
+        self._regexes = []  # (name, compiled)
+        self._keywords = {False: {}, True: {}}  # ignore case -> {keyword: [names]}
+        self._tries = None
+        self._last = (None, None)
+
+    def add(self, name, pattern, literal=False, flags=0):
+        """
+        :param name: name reported by matches()
+        :param pattern: regex, or keyword if literal is True
+        :param literal: True to match pattern as plain text
+        :param flags: re flags, for keywords only re.IGNORECASE
+        """
+        if name in self._names:
+            raise KeyError(f"Duplicate filter {name}")
+        self._names.add(name)
+        if literal and pattern and not flags & ~re.IGNORECASE:
+            ignore_case = bool(flags & re.IGNORECASE)
+            keyword = pattern.lower() if ignore_case else pattern
+            self._keywords[ignore_case].setdefault(keyword, []).append(name)
+        else:
+            self._regexes.append((name, re.compile(re.escape(pattern) if literal else pattern, flags)))
+        self._tries = None
+        self._last = (None, None)
+        return self
+
+    def _compile(self):
+        self._tries = []
+        for ignore_case, keywords in self._keywords.items():
+            if not keywords:
+                continue
+            pattern, names = _trie_regex(keywords, ignore_case)
+            self._tries.append((re.compile(f"(?={pattern})", re.IGNORECASE if ignore_case else 0), names))
+        self._keyword_count = sum(len(names) for keywords in self._keywords.values() for names in keywords.values())
+
+    def _scan(self, text, first):
+        if self._tries is None:
+            self._compile()
+        matched = set()
+        for regex, names in self._tries:
+            for match in regex.finditer(text):
+                # The group closed last marks the end of the longest keyword, whatever case folding matched it
+                matched.update(names[match.lastgroup])
+                if first or len(matched) == self._keyword_count:
+                    break
+            if first and matched:
+                return matched
+        for name, compiled in self._regexes:
+            if compiled.search(text):
+                matched.add(name)
+                if first:
+                    return matched
+        return matched
+
+    def matches(self, text):
+        """
+        :return: set of names of all patterns found in text
+        """
+        return self._scan(text or "", first=False)
+
+    def first_match(self, text):
+        """
+        Stops at the first match, cheaper than matches() if any match is enough.
+
+        :return: name of a pattern found in text, None if nothing found
+        """
+        matched = self._scan(text or "", first=True)
+        return matched.pop() if matched else None
+
+    def matches_message(self, message):
+        """
+        Same as matches(message.text). Result for the last message is cached, so all filters of this set created
+        by filter() scan a message only once.
+        """
+        last_message, last_result = self._last
+        if message is not last_message:
+            last_result = self.matches(message.text)
+            self._last = (message, last_result)
+        return last_result
+
+    def filter(self, *names):
+        """
+        :return: telegram filter which passes messages matching any of names, any pattern of the set if no names
+        """
+        return FilterSetFilter(self, names)
+
+
+def _trie_regex(keywords, ignore_case=False):
+    """
+    Regex matching the longest of keywords, shaped as a trie, with an empty named group at the end of every keyword:
+    ['foo', 'foobar', 'fig'] -> 'f(?:ig(?P<k0>)|oo(?P<k1>)(?:bar(?P<k2>))?)'
+
+    The group closed last (match.lastgroup) tells which keyword matched, keywords which are its prefixes matched
+    too. With ignore_case, characters the regex engine treats as equal share a trie node ("ſ" and "s").
+
+    :param keywords: {keyword: [names]}
+    :return: (pattern, {group name: names of the keyword and of its prefixes})
+    """
+    trie = {}
+    for keyword, keyword_names in keywords.items():
+        node = trie
+        for char in keyword:
+            node = node.setdefault(_fold_char(char) if ignore_case else char, {})
+        node.setdefault("", []).extend(keyword_names)
+    group_names = {}
+
+    def build(node, names):
+        marker = ""
+        if "" in node:
+            names = names + node[""]
+            marker = f"(?P<k{len(group_names)}>)"
+            group_names[f"k{len(group_names)}"] = names
+        alternatives = [re.escape(char) + build(child, names) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return marker
+        body = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+        return marker + f"(?:{body})?" if marker else body
+
+    return build(trie, []), group_names
+
+
+def _fold_char(char):
+    # "ſ" -> "s", "K" (Kelvin sign) -> "k": same class as re.IGNORECASE, unlike str.lower() alone
+    lower = char.lower()
+    if len(lower) != 1:
+        return char
+    folded = lower.upper().lower()
+    return folded if len(folded) == 1 else lower
+
+
 try:
     from telegram.ext import BaseFilter
 
@@ -8,10 +163,20 @@ try:
         pattern = None
 
         def __init__(self, pattern):
-            self.pattern = pattern
+            self.pattern = re.compile(pattern)
 
         def filter(self, message):
-            return bool(re.findall(self.pattern, message.text))
+            return self.pattern.search(message.text) is not None
+
+
+    class FilterSetFilter(BaseFilter):
+        def __init__(self, filter_set, names=()):
+            self.filter_set = filter_set
+            self.names = set(names)
+
+        def filter(self, message):
+            if not self.names:
+                return self.filter_set.first_match(message.text) is not None
+            return not self.names.isdisjoint(self.filter_set.matches_message(message))
 except ModuleNotFoundError:
     pass
-
@@ -0,0 +1,258 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # pip install python-telegram-bot
+    from telegram.error import BadRequest, RetryAfter
+except ModuleNotFoundError:
+    pass
+
+from .rate_limiter import default_rate_limiter
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_chat_id ON outbox (chat_id, id);
+CREATE TABLE IF NOT EXISTS outbox_dead_letters (
+    id INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL,
+    idempotency_key TEXT,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS outbox_sent (
+    idempotency_key TEXT PRIMARY KEY,
+    sent_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_sent_sent_at ON outbox_sent (sent_at);
+"""
+
+
+class Outbox:
+    """
+    Persistent queue of outgoing messages stored in SQLite, drained by a background sender thread.
+
+    Messages to the same chat are sent strictly in order: only the oldest message of a chat is sent, later ones
+    wait until it's delivered or dead. Failed sends are retried with exponential backoff and jitter, after
+    max_attempts failures (or at once on BadRequest, which retrying won't fix) message is moved to
+    outbox_dead_letters. Messages with an idempotency_key which is already in the outbox, or was delivered or moved
+    to dead letters within idempotency_ttl seconds (kept in outbox_sent), are ignored.
+
+    Usage:
+
+    >>> outbox = Outbox(bot, "outbox.sqlite3")
+    >>> outbox.start()
+    >>> send_message(bot, user_id, text, outbox=outbox)  # returns right after enqueueing
+    >>> outbox.stop()
+
+    :param bot: telegram.Bot
+    :param path: SQLite database file
+    :param max_attempts: failures after which message is moved to dead letters
+    :param base_delay: delay in seconds before the first retry, doubles with every next one
+    :param max_delay: max delay in seconds between retries
+    :param rate_limiter: RateLimiter, None to send without limits
+    :param max_workers: number of chats served at once
+    :param poll_interval: seconds between checks for due messages when the outbox is idle
+    :param idempotency_ttl: seconds idempotency keys of sent and dead messages are kept
+    """
+
+    def __init__(self, bot, path="outbox.sqlite3", max_attempts=5, base_delay=1, max_delay=300,
+                 rate_limiter=default_rate_limiter, max_workers=4, poll_interval=1, idempotency_ttl=7 * 24 * 3600):
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = rate_limiter
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.idempotency_ttl = idempotency_ttl
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def enqueue(self, chat_id, text, parse_mode="MARKDOWN", reply_markup=None, disable_web_page_preview=True,
+                idempotency_key=None):
+        """
+        :return: id of the queued message, None if a message with the same idempotency_key is already queued
+            or was recently sent
+        """
+        if reply_markup is not None and hasattr(reply_markup, "to_json"):
+            reply_markup = reply_markup.to_json()
+        payload = json.dumps({
+            "text": text,
+            "parse_mode": parse_mode,
+            "reply_markup": reply_markup,
+            "disable_web_page_preview": disable_web_page_preview,
+        })
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                if idempotency_key is not None:
+                    self._db.execute("DELETE FROM outbox_sent WHERE sent_at < ?", (now - self.idempotency_ttl,))
+                    if self._db.execute("SELECT 1 FROM outbox_sent WHERE idempotency_key = ?",
+                                        (idempotency_key,)).fetchone():
+                        return None
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO outbox (chat_id, idempotency_key, payload, next_attempt_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (str(chat_id), idempotency_key, payload, now, now),
+                )
+        self._wakeup.set()
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letters(self):
+        """
+        :return: list of dicts, one per dead message
+        """
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM outbox_dead_letters ORDER BY id")
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _due(self, limit):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, chat_id, payload, attempts FROM outbox "
+                "WHERE id IN (SELECT MIN(id) FROM outbox GROUP BY chat_id) AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+
+    def _send(self, row):
+        id_, chat_id, payload, attempts = row
+        # Same rate limiter key as direct sends to the int chat id
+        chat_id = _chat_id(chat_id)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(chat_id)
+        try:
+            self.bot.send_message(chat_id=chat_id, **json.loads(payload))
+        except RetryAfter as e:
+            if self.rate_limiter is not None:
+                self.rate_limiter.pause_chat(chat_id, e.retry_after)
+            self._retry(id_, attempts, e, delay=e.retry_after, count_attempt=False)
+        except BadRequest as e:
+            self._kill(id_, e)
+        except Exception as e:
+            if attempts + 1 >= self.max_attempts:
+                self._kill(id_, e)
+            else:
+                self._retry(id_, attempts, e)
+        else:
+            with self._lock:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._remove(id_)
+
+    def _retry(self, id_, attempts, error, delay=None, count_attempt=True):
+        if delay is None:
+            # Exponential backoff with "equal jitter"
+            delay = min(self.max_delay, self.base_delay * 2 ** attempts)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        logging.warning(f"Outbox message {id_} failed ({error}), retry in {delay:.1f}s")
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (int(count_attempt), time.time() + delay, str(error), id_),
+            )
+
+    def _kill(self, id_, error):
+        logging.error(f"Outbox message {id_} moved to dead letters: {error}")
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute(
+                    "INSERT INTO outbox_dead_letters "
+                    "SELECT id, chat_id, idempotency_key, payload, attempts + 1, created_at, ?, ? "
+                    "FROM outbox WHERE id = ?",
+                    (time.time(), str(error), id_),
+                )
+                self._remove(id_)
+
+    def _remove(self, id_):
+        """
+        Deletes a sent or dead message, keeping its idempotency_key in outbox_sent. Called in a transaction.
+        """
+        self._db.execute(
+            "INSERT OR REPLACE INTO outbox_sent (idempotency_key, sent_at) "
+            "SELECT idempotency_key, ? FROM outbox WHERE id = ? AND idempotency_key IS NOT NULL",
+            (time.time(), id_),
+        )
+        self._db.execute("DELETE FROM outbox WHERE id = ?", (id_,))
+
+    def drain_once(self, executor=None):
+        """
+        Sends every message which is due now, at most one per chat.
+
+        :return: number of messages processed (sent, rescheduled or dead)
+        """
+        rows = self._due(limit=self.max_workers * 16)
+        if executor is None:
+            for row in rows:
+                self._send(row)
+        else:
+            list(executor.map(self._send, rows))
+        return len(rows)
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self._stopping.is_set():
+                try:
+                    processed = self.drain_once(executor)
+                except Exception as e:
+                    logging.critical(f"Outbox sender failed: {e}")
+                    processed = 0
+                if not processed:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="telegram-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops the sender thread. Messages still in the outbox stay in the database for the next start.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def _chat_id(value):
+    """
+    chat_id as it was given to enqueue: ids are stored as TEXT, "123" -> 123, "@channel" stays as is.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return value
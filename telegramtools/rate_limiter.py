@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+PER_GROUP_RATE = 20 / 60
+
+
+class TokenBucket:
+    """
+    Token bucket implemented as GCRA: instead of counting tokens it keeps the time when the bucket is empty again,
+    so a single float is enough and time to wait is known without polling.
+
+    :param rate: tokens per second
+    :param capacity: max burst size
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.interval = 1 / rate
+        self.tolerance = (capacity - 1) * self.interval
+        self.tat = 0.0  # theoretical arrival time of the next token
+
+    def allowed_at(self, now):
+        return max(self.tat - self.tolerance, now)
+
+    def reserve(self, at):
+        self.tat = max(self.tat, at) + self.interval
+
+    def idle(self, now):
+        return self.tat <= now
+
+
+class RateLimiter:
+    """
+    Global bucket plus one bucket per chat, shared by all threads and event loops of the process. acquire() reserves
+    a slot in the chat bucket, then in the global one, and sleeps until they come. The lock is not held while
+    sleeping. Negative chat ids are groups and get PER_GROUP_RATE instead of PER_CHAT_RATE.
+
+    Usage:
+
+    >>> limiter.acquire(chat_id)                 # in threads
+    >>> await limiter.acquire_async(chat_id)     # in asyncio
+    >>> limiter.pause_chat(chat_id, e.retry_after)  # after telegram.error.RetryAfter
+
+    :param global_rate: messages per second for the whole bot
+    :param per_chat_rate: messages per second to a private chat
+    :param per_group_rate: messages per second to a group
+    :param per_chat_burst: messages to one chat which can be sent at once before the rate applies
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE, per_group_rate=PER_GROUP_RATE,
+                 per_chat_burst=3):
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_group_rate = per_group_rate
+        self.per_chat_burst = per_chat_burst
+        self._chat_buckets = {}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10000:
+                self._prune(time.monotonic())
+            rate = self.per_group_rate if _is_group(chat_id) else self.per_chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, capacity=self.per_chat_burst)
+        return bucket
+
+    def _prune(self, now):
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.idle(now)]:
+            del self._chat_buckets[chat_id]
+        for chat_id in [chat_id for chat_id, until in self._paused_until.items() if until <= now]:
+            del self._paused_until[chat_id]
+
+    def _reserve_chat(self, chat_id):
+        with self._lock:
+            now = time.monotonic()
+            chat_bucket = self._chat_bucket(chat_id)
+            at = max(chat_bucket.allowed_at(now), self._paused_until.get(chat_id, now))
+            chat_bucket.reserve(at)
+            return at - now
+
+    def _reserve_global(self):
+        with self._lock:
+            now = time.monotonic()
+            at = self.global_bucket.allowed_at(now)
+            self.global_bucket.reserve(at)
+            return at - now
+
+    def _waits(self, chat_id):
+        # Global slot is reserved only after the chat slot came, so a chat waiting for its own limit
+        # doesn't hold back messages to other chats.
+        yield self._reserve_chat(chat_id)
+        yield self._reserve_global()
+
+    def acquire(self, chat_id):
+        for wait in self._waits(chat_id):
+            if wait > 0:
+                time.sleep(wait)
+
+    async def acquire_async(self, chat_id):
+        for wait in self._waits(chat_id):
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    def pause_chat(self, chat_id, retry_after):
+        """
+        Stops sending to chat_id for retry_after seconds (from telegram.error.RetryAfter), other chats are not
+        affected.
+        """
+        if isinstance(retry_after, timedelta):
+            retry_after = retry_after.total_seconds()
+        with self._lock:
+            until = time.monotonic() + retry_after
+            self._paused_until[chat_id] = max(self._paused_until.get(chat_id, 0), until)
+
+
+def _is_group(chat_id):
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        # @channelusername
+        return True
+
+
+default_rate_limiter = RateLimiter()
@@ -1,14 +1,30 @@
+import asyncio
+import inspect
+import re
 import time
+import weakref
+from bisect import bisect_right
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 
 try:
     # pip install python-telegram-bot
     import telegram
     from telegram import MAX_MESSAGE_LENGTH, TelegramError
-    from telegram.error import BadRequest, NetworkError
+    from telegram.error import BadRequest, NetworkError, RetryAfter
 except ModuleNotFoundError:
     pass
 
 from ..generaltools.blaster_logger import log_this, logger  # uses log_this and logger from general/blaster_logger.py
+from .rate_limiter import default_rate_limiter
+
+RETRY_AFTER_ATTEMPTS = 3
+
+# Every MessageCoalescer, their buffers are flushed before a message to the same chat is sent without them
+_coalescers = weakref.WeakSet()
+
+BroadcastResult = namedtuple("BroadcastResult", ["user_id", "sent", "error"])
 
 
 @log_this
@@ -19,6 +35,10 @@ def send_message(
     parse_mode="MARKDOWN",
     reply_markup=None,
     disable_web_page_preview=True,
+    rate_limiter=default_rate_limiter,
+    outbox=None,
+    idempotency_key=None,
+    coalescer=None,
 ):
     """
     Sends message to user_id.
@@ -27,16 +47,45 @@ def send_message(
     list of 1 item. Send messages from list. Handles all kinds of possible errors while sending and tries to deliver
     anyway. Doesn't guarantee delivery.
 
+    Throughput is limited by rate_limiter (shared by the whole process by default), RetryAfter from Telegram pauses
+    only the affected chat.
+
+    If outbox is given, chunks are only put into it and sent by its background sender with retries, see Outbox.
+    If coalescer is given (and there's no reply_markup), message is buffered and sent later together with other
+    messages to the same chat, see MessageCoalescer.
+
     :param bot:
     :param user_id:
     :param response:
     :param parse_mode:
     :param reply_markup:
     :param disable_web_page_preview:
-    :return: sent object of the last message sent
+    :param rate_limiter: RateLimiter, None to send without limits
+    :param outbox: Outbox to enqueue the message to instead of sending it
+    :param idempotency_key: with outbox, messages with a key which is already in the outbox are ignored
+    :param coalescer: MessageCoalescer to buffer the message in instead of sending it
+    :return: sent object of the last message sent, with outbox list of ids of the queued chunks, with coalescer None
     """
 
-    split_message = _split_message_by_telegram_requirements(response)
+    if coalescer is not None and reply_markup is None:
+        coalescer.add(user_id, response, parse_mode)
+        return None
+    for pending in list(_coalescers):
+        pending.flush(user_id)
+
+    split_message = _split_message_by_telegram_requirements(response, parse_mode)
+    if outbox is not None:
+        return [
+            outbox.enqueue(
+                user_id,
+                chunk,
+                parse_mode=parse_mode,
+                reply_markup=reply_markup,
+                disable_web_page_preview=disable_web_page_preview,
+                idempotency_key=f"{idempotency_key}:{i}" if idempotency_key is not None else None,
+            )
+            for i, chunk in enumerate(split_message)
+        ]
     return _send_split_message(
         bot,
         user_id,
@@ -44,6 +93,7 @@ def send_message(
         parse_mode=parse_mode,
         reply_markup=reply_markup,
         disable_web_page_preview=disable_web_page_preview,
+        rate_limiter=rate_limiter,
     )
 
 
@@ -55,43 +105,139 @@ def _send_single_message(
     parse_mode="MARKDOWN",
     reply_markup=None,
     disable_web_page_preview=True,
+    rate_limiter=None,
 ):
     sent = None
-    try:
-        sent = bot.send_message(
-            chat_id=telegram_id,
-            text=message,
-            parse_mode=parse_mode,
-            reply_markup=reply_markup,
-            disable_web_page_preview=disable_web_page_preview,
-        )
-    except BadRequest as e:
-        logger.error(f"{e}: {telegram_id}")
-    except NetworkError:
-        logger.error(NetworkError)
-    except TelegramError as e:
-        error_msg = f"TelegramError while sending message: {e}"
-        logger.error(error_msg)
-        sent = bot.send_message(
-            chat_id=telegram_id,
-            text=message.replace("\\", ""),
-            parse_mode=None,
-            reply_markup=reply_markup,
-            disable_web_page_preview=disable_web_page_preview,
-        )
-    except UnicodeEncodeError as e:
-        logger.warning(f"send_message: {e}")
+    for _ in range(RETRY_AFTER_ATTEMPTS):
+        if rate_limiter is not None:
+            rate_limiter.acquire(telegram_id)
+        try:
+            sent = bot.send_message(
+                chat_id=telegram_id,
+                text=message,
+                parse_mode=parse_mode,
+                reply_markup=reply_markup,
+                disable_web_page_preview=disable_web_page_preview,
+            )
+        except RetryAfter as e:
+            logger.warning(f"Flood control exceeded for {telegram_id}, retry in {e.retry_after}s")
+            if rate_limiter is not None:
+                rate_limiter.pause_chat(telegram_id, e.retry_after)
+            else:
+                time.sleep(e.retry_after)
+            continue
+        except BadRequest as e:
+            logger.error(f"{e}: {telegram_id}")
+        except NetworkError:
+            logger.error(NetworkError)
+        except TelegramError as e:
+            error_msg = f"TelegramError while sending message: {e}"
+            logger.error(error_msg)
+            if rate_limiter is not None:
+                rate_limiter.acquire(telegram_id)
+            sent = bot.send_message(
+                chat_id=telegram_id,
+                text=message.replace("\\", ""),
+                parse_mode=None,
+                reply_markup=reply_markup,
+                disable_web_page_preview=disable_web_page_preview,
+            )
+        except UnicodeEncodeError as e:
+            logger.warning(f"send_message: {e}")
+        break
+    else:
+        logger.error(f"Message to {telegram_id} dropped: flood control exceeded {RETRY_AFTER_ATTEMPTS} times in a row")
 
     return sent
 
 
 @log_this
-def _split_message_by_telegram_requirements(message):
-    chunks, chunk_size = len(message), MAX_MESSAGE_LENGTH
-    split_message = [message[i : i + chunk_size] for i in range(0, chunks, chunk_size)]
+def _split_message_by_telegram_requirements(message, parse_mode=None, max_length=None):
+    """
+    Splits message into chunks of up to max_length (MAX_MESSAGE_LENGTH by default). Cuts on the last newline,
+    or the last space, outside of Markdown/HTML entities (according to parse_mode) that fits into the chunk.
+    Falls back to newlines and spaces inside entities and then to a hard cut.
+    """
+    max_length = max_length or MAX_MESSAGE_LENGTH
+    if len(message) <= max_length:
+        return [message] if message else []
+
+    preferences = _split_boundaries(message, parse_mode)
+    split_message = []
+    start = 0
+    while len(message) - start > max_length:
+        limit = start + max_length
+        for boundaries in preferences:
+            i = bisect_right(boundaries, limit) - 1
+            if i >= 0 and boundaries[i] > start:
+                end, next_start = boundaries[i], boundaries[i] + 1
+                break
+        else:
+            end = next_start = limit
+        split_message.append(message[start:end])
+        start = next_start
+    if start < len(message):
+        split_message.append(message[start:])
     return split_message
 
 
+_MARKDOWN_TOKENS = re.compile(r"\\.|```|\|\||\]\(|[*_~`\[)\n ]")
+_HTML_TOKENS = re.compile(r"<(/?)[a-zA-Z][^>]*>|[\n ]")
+_PLAIN_TOKENS = re.compile(r"[\n ]")
+
+
+def _split_boundaries(message, parse_mode):
+    """
+    :return: lists of positions of newlines and spaces, from the most to the least preferred place to cut:
+             [newlines outside entities, spaces outside entities, all newlines, all spaces]
+    """
+    safe = {"\n": [], " ": []}
+    unsafe = {"\n": [], " ": []}
+    mode = (parse_mode or "").lower()
+    if mode == "html":
+        depth = 0
+        for match in _HTML_TOKENS.finditer(message):
+            token = match.group()
+            if token in safe:
+                (unsafe if depth else safe)[token].append(match.start())
+            else:
+                depth = max(depth + (-1 if match.group(1) else 1), 0)
+    elif mode in ("markdown", "markdownv2"):
+        v2 = mode == "markdownv2"
+        opened = set()
+        code = None
+        link = 0  # 1 in [text], 2 in (url)
+        for match in _MARKDOWN_TOKENS.finditer(message):
+            token = match.group()
+            if token[0] == "\\":
+                continue
+            if token in safe:
+                (unsafe if code or opened or link else safe)[token].append(match.start())
+            elif code:
+                if token == code:
+                    code = None
+            elif token in ("```", "`"):
+                code = token
+            elif token == "[" and not link:
+                link = 1
+            elif token == "](" and link == 1:
+                link = 2
+            elif token == ")" and link == 2:
+                link = 0
+            elif link != 2 and (token in ("*", "_") or v2 and token in ("~", "||")):
+                opened ^= {token}
+    else:
+        for match in _PLAIN_TOKENS.finditer(message):
+            safe[match.group()].append(match.start())
+
+    return [
+        safe["\n"],
+        safe[" "],
+        sorted(safe["\n"] + unsafe["\n"]),
+        sorted(safe[" "] + unsafe[" "]),
+    ]
+
+
 @log_this
 def _send_split_message(
     bot,
@@ -100,7 +246,9 @@ def _send_split_message(
     parse_mode=None,
     reply_markup=None,
     disable_web_page_preview=None,
+    rate_limiter=None,
 ):
+    # Pauses between chunks are up to rate_limiter
     for i in range(len(split_message)):
         if i < (len(split_message) - 1):
             _send_single_message(
@@ -110,8 +258,8 @@ def _send_split_message(
                 parse_mode=parse_mode,
                 reply_markup=reply_markup,
                 disable_web_page_preview=disable_web_page_preview,
+                rate_limiter=rate_limiter,
             )
-            time.sleep(1)
         else:
             return _send_single_message(
                 bot,
@@ -120,4 +268,209 @@ def _send_split_message(
                 parse_mode=parse_mode,
                 reply_markup=reply_markup,
                 disable_web_page_preview=disable_web_page_preview,
+                rate_limiter=rate_limiter,
+            )
+
+
+def broadcast(
+    bot,
+    user_ids,
+    response,
+    parse_mode="MARKDOWN",
+    reply_markup=None,
+    disable_web_page_preview=True,
+    rate_limiter=default_rate_limiter,
+    backend="threads",
+    max_workers=16,
+    progress_callback=None,
+):
+    """
+    Sends the same message to many users concurrently. Message is split once, chunks of it are sent to every user
+    in order. Throughput is limited by rate_limiter, see send_message. If a chunk isn't delivered, the rest of the
+    message isn't sent to that user and the result has an error.
+
+    Usage:
+
+    >>> results = broadcast(bot, subscriber_ids, text, progress_callback=lambda done, total, result: ...)
+    >>> failed = [result.user_id for result in results if result.error]
+
+    :param bot: telegram.Bot or any object with the same send_message, may be async with backend="asyncio"
+    :param user_ids: iterable of chat ids
+    :param response:
+    :param parse_mode:
+    :param reply_markup:
+    :param disable_web_page_preview:
+    :param rate_limiter: RateLimiter, None to send without limits
+    :param backend: "threads" for a thread pool, "asyncio" to run broadcast_async in a new event loop
+    :param max_workers: number of threads, or number of users served at once with asyncio
+    :param progress_callback: progress_callback(done, total, result) called after each user
+    :return: list of BroadcastResult(user_id, sent, error) in order of user_ids
+    """
+    if backend == "asyncio":
+        return asyncio.run(broadcast_async(
+            bot,
+            user_ids,
+            response,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup,
+            disable_web_page_preview=disable_web_page_preview,
+            rate_limiter=rate_limiter,
+            concurrency=max_workers,
+            progress_callback=progress_callback,
+        ))
+    if backend != "threads":
+        raise ValueError(f'backend must be "threads" or "asyncio", not {backend!r}')
+
+    split_message = _split_message_by_telegram_requirements(response, parse_mode)
+    user_ids = list(user_ids)
+
+    def deliver(user_id):
+        sent = None
+        try:
+            # Stops at the first chunk which wasn't delivered, the next ones would make no sense without it
+            for i, message in enumerate(split_message):
+                sent = _send_single_message(
+                    bot,
+                    user_id,
+                    message,
+                    parse_mode=parse_mode,
+                    reply_markup=reply_markup,
+                    disable_web_page_preview=disable_web_page_preview,
+                    rate_limiter=rate_limiter,
+                )
+                if sent is None:
+                    return _broadcast_failure(user_id, i, len(split_message))
+        except Exception as e:
+            return BroadcastResult(user_id, None, e)
+        return _broadcast_result(user_id, sent)
+
+    results = [None] * len(user_ids)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(deliver, user_id): i for i, user_id in enumerate(user_ids)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress_callback is not None:
+                progress_callback(done, len(user_ids), future.result())
+    return results
+
+
+async def broadcast_async(
+    bot,
+    user_ids,
+    response,
+    parse_mode="MARKDOWN",
+    reply_markup=None,
+    disable_web_page_preview=True,
+    rate_limiter=default_rate_limiter,
+    concurrency=16,
+    progress_callback=None,
+):
+    """
+    Same as broadcast for a running event loop. Async bots (send_message is a coroutine function) are awaited
+    directly, sync bots are called in the default executor.
+
+    :param concurrency: number of users served at once
+    :return: list of BroadcastResult(user_id, sent, error) in order of user_ids
+    """
+    split_message = _split_message_by_telegram_requirements(response, parse_mode)
+    user_ids = list(user_ids)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver(user_id):
+        async with semaphore:
+            sent = None
+            try:
+                for i, message in enumerate(split_message):
+                    sent = await _send_single_message_async(
+                        bot,
+                        user_id,
+                        message,
+                        parse_mode=parse_mode,
+                        reply_markup=reply_markup,
+                        disable_web_page_preview=disable_web_page_preview,
+                        rate_limiter=rate_limiter,
+                    )
+                    if sent is None:
+                        return _broadcast_failure(user_id, i, len(split_message))
+            except Exception as e:
+                return BroadcastResult(user_id, None, e)
+            return _broadcast_result(user_id, sent)
+
+    tasks = [asyncio.ensure_future(deliver(user_id)) for user_id in user_ids]
+    for done, task in enumerate(asyncio.as_completed(tasks), 1):
+        result = await task
+        if progress_callback is not None:
+            progress_callback(done, len(user_ids), result)
+    return [task.result() for task in tasks]
+
+
+def _broadcast_result(user_id, sent):
+    if sent is None:
+        return BroadcastResult(user_id, None, RuntimeError(f"Message to {user_id} not delivered, see log"))
+    return BroadcastResult(user_id, sent, None)
+
+
+def _broadcast_failure(user_id, chunk, chunks):
+    error = RuntimeError(f"Chunk {chunk + 1} of {chunks} of message to {user_id} not delivered, see log")
+    return BroadcastResult(user_id, None, error)
+
+
+@log_this
+async def _send_single_message_async(
+    bot,
+    telegram_id,
+    message,
+    parse_mode="MARKDOWN",
+    reply_markup=None,
+    disable_web_page_preview=True,
+    rate_limiter=None,
+):
+    """
+    Same as _send_single_message for asyncio.
+    """
+    if inspect.iscoroutinefunction(bot.send_message):
+        send = bot.send_message
+    else:
+        send = partial(asyncio.to_thread, bot.send_message)
+
+    sent = None
+    for _ in range(RETRY_AFTER_ATTEMPTS):
+        if rate_limiter is not None:
+            await rate_limiter.acquire_async(telegram_id)
+        try:
+            sent = await send(
+                chat_id=telegram_id,
+                text=message,
+                parse_mode=parse_mode,
+                reply_markup=reply_markup,
+                disable_web_page_preview=disable_web_page_preview,
+            )
+        except RetryAfter as e:
+            logger.warning(f"Flood control exceeded for {telegram_id}, retry in {e.retry_after}s")
+            if rate_limiter is not None:
+                rate_limiter.pause_chat(telegram_id, e.retry_after)
+            else:
+                await asyncio.sleep(e.retry_after)
+            continue
+        except BadRequest as e:
+            logger.error(f"{e}: {telegram_id}")
+        except NetworkError:
+            logger.error(NetworkError)
+        except TelegramError as e:
+            logger.error(f"TelegramError while sending message: {e}")
+            if rate_limiter is not None:
+                await rate_limiter.acquire_async(telegram_id)
+            sent = await send(
+                chat_id=telegram_id,
+                text=message.replace("\\", ""),
+                parse_mode=None,
+                reply_markup=reply_markup,
+                disable_web_page_preview=disable_web_page_preview,
             )
+        except UnicodeEncodeError as e:
+            logger.warning(f"send_message: {e}")
+        break
+    else:
+        logger.error(f"Message to {telegram_id} dropped: flood control exceeded {RETRY_AFTER_ATTEMPTS} times in a row")
+
+    return sent
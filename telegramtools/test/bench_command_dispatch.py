@@ -0,0 +1,24 @@
+"""
+Measures command_dispatch cost per update with a no-op handler. Run from the repository root:
+
+    python -m telegramtools.test.bench_command_dispatch
+"""
+import logging
+import timeit
+
+from .test_command_dispatcher import make_dispatcher, make_update
+
+N = 100000
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    handle = make_dispatcher()
+    for text in ("/start", "/begin_x1@my_bot arg1 arg2", "/adminstats", "/unknown"):
+        update = make_update(text)
+        elapsed = timeit.timeit(lambda: handle(update, None), number=N)
+        print(f"{text!r}: {elapsed / N * 1e6:.2f}us per update")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from .. import bot_logger
+from ..bot_logger import ExceptionReporter
+
+
+class StubBot:
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text):
+        with self._lock:
+            self.sent.append(text)
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+    # let the sender thread finish its summary check
+    time.sleep(0.05)
+
+
+def failing():
+    pass
+
+
+def other():
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(bot_logger, "time", fake)
+    return fake
+
+
+def test_same_kind_is_suppressed_and_summarized(clock):
+    bot = StubBot()
+    reporter = ExceptionReporter(bot, 1, summary_interval=1000)
+    reporter.report(failing, ValueError("first"))
+    reporter.report(failing, ValueError("second"))
+    reporter.report(failing, ValueError("third"))
+    reporter.report(failing, KeyError("other kind"))
+    reporter.report(other, ValueError("other function"))
+    wait_for(lambda: len(bot.sent) == 3)
+    assert "first" in bot.sent[0] and "other kind" in bot.sent[1] and "other function" in bot.sent[2]
+
+    clock.now += 999
+    assert reporter._summaries() == []
+    clock.now += 1
+    summaries = reporter._summaries()
+    assert len(summaries) == 1
+    assert "third" in summaries[0] and "happened 2 times in the last 1000s" in summaries[0]
+    assert reporter._summaries() == []
+
+
+def test_report_after_window_carries_suppressed_count(clock):
+    bot = StubBot()
+    reporter = ExceptionReporter(bot, 1, summary_interval=1000)
+    reporter.report(failing, ValueError("first"))
+    wait_for(lambda: len(bot.sent) == 1)
+    reporter.report(failing, ValueError("second"))
+    reporter.report(failing, ValueError("third"))
+
+    clock.now += 1000
+    reporter.report(failing, ValueError("fourth"))
+    wait_for(lambda: len(bot.sent) == 2)
+    assert "fourth" in bot.sent[1] and "(+2 similar since last report)" in bot.sent[1]
+
+    clock.now += 1000
+    reporter.report(failing, ValueError("fifth"))
+    wait_for(lambda: len(bot.sent) == 3)
+    assert "similar" not in bot.sent[2]
+
+
+def test_close_flushes_pending_summaries(clock):
+    bot = StubBot()
+    reporter = ExceptionReporter(bot, 1, summary_interval=1000)
+    reporter.report(failing, ValueError("first"))
+    reporter.report(failing, ValueError("second"))
+    reporter.close()
+    wait_for(lambda: len(bot.sent) == 2)
+
+    assert "first" in bot.sent[0]
+    assert "second" in bot.sent[1] and "happened 1 times" in bot.sent[1]
+
+
+def test_sender_errors_are_logged(clock, caplog):
+    class BrokenBot:
+        def send_message(self, chat_id, text):
+            raise ConnectionError("offline")
+
+    reporter = ExceptionReporter(BrokenBot(), 1, summary_interval=1000)
+    reporter.report(failing, ValueError("lost"))
+    wait_for(lambda: any("offline" in record.getMessage() for record in caplog.records))
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+from ..send_message import broadcast, broadcast_async
+
+
+class FakeBot:
+    def __init__(self, fail_for=()):
+        self.fail_for = set(fail_for)
+        self.sent = {}
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.fail_for:
+            raise ConnectionError(f"Can't reach {chat_id}")
+        with self._lock:
+            self.sent.setdefault(chat_id, []).append(text)
+        return text
+
+
+class AsyncFakeBot(FakeBot):
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        return FakeBot.send_message(self, chat_id, text, **kwargs)
+
+
+def test_broadcast_threads_report_and_progress():
+    bot = FakeBot(fail_for=[3])
+    progress = []
+    results = broadcast(bot, [1, 2, 3, 4], "hello", rate_limiter=None,
+                        progress_callback=lambda done, total, result: progress.append((done, total)))
+
+    assert [result.user_id for result in results] == [1, 2, 3, 4]
+    assert [result.sent for result in results] == ["hello", "hello", None, "hello"]
+    assert isinstance(results[2].error, ConnectionError)
+    assert sorted(progress) == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+def test_broadcast_keeps_chunk_order():
+    bot = FakeBot()
+    text = "a" * 4096 + "b" * 4096 + "c"
+    broadcast(bot, range(10), text, rate_limiter=None, max_workers=4)
+
+    assert all(chunks == ["a" * 4096, "b" * 4096, "c"] for chunks in bot.sent.values())
+    assert len(bot.sent) == 10
+
+
+def test_broadcast_asyncio_backend():
+    bot = AsyncFakeBot(fail_for=[2])
+    results = broadcast(bot, [1, 2, 3], "hello", rate_limiter=None, backend="asyncio")
+
+    assert [result.error is None for result in results] == [True, False, True]
+    assert bot.sent == {1: ["hello"], 3: ["hello"]}
+
+
+def test_broadcast_async_with_sync_bot():
+    bot = FakeBot()
+    results = asyncio.run(broadcast_async(bot, [1, 2], "hello", rate_limiter=None))
+
+    assert [result.sent for result in results] == ["hello", "hello"]
+
+
+def test_retry_after_exhausted_is_logged(caplog):
+    from telegram.error import RetryAfter
+
+    from ..send_message import RETRY_AFTER_ATTEMPTS, _send_single_message
+
+    class FloodedBot:
+        calls = 0
+
+        def send_message(self, **kwargs):
+            self.calls += 1
+            raise RetryAfter(0)
+
+    bot = FloodedBot()
+    assert _send_single_message(bot, 7, "hello") is None
+    assert bot.calls == RETRY_AFTER_ATTEMPTS
+    assert any("Message to 7 dropped" in record.getMessage() for record in caplog.records)
+
+
+class FailingChunkBot(FakeBot):
+    def send_message(self, chat_id, text, **kwargs):
+        from telegram.error import BadRequest
+
+        if text.startswith("a"):
+            raise BadRequest("Can't parse entities")
+        return FakeBot.send_message(self, chat_id, text, **kwargs)
+
+
+class AsyncFailingChunkBot(FailingChunkBot):
+    async def send_message(self, chat_id, text, **kwargs):
+        return FailingChunkBot.send_message(self, chat_id, text, **kwargs)
+
+
+def test_broadcast_stops_at_failed_chunk():
+    text = "a" * 4096 + "b"
+    for backend, bot in (("threads", FailingChunkBot()), ("asyncio", AsyncFailingChunkBot())):
+        results = broadcast(bot, [1, 2], text, rate_limiter=None, backend=backend)
+
+        assert [result.sent for result in results] == [None, None]
+        assert all("Chunk 1 of 2" in str(result.error) for result in results)
+        assert bot.sent == {}
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+
+from ..chat_executor import AsyncChatExecutor, ChatExecutor
+
+
+def test_chat_executor_keeps_order_per_chat():
+    executor = ChatExecutor(max_workers=4, name="test-chat-executor")
+    seen = {}
+    lock = threading.Lock()
+
+    def handle(chat_id, i):
+        time.sleep(0.001)
+        with lock:
+            seen.setdefault(chat_id, []).append(i)
+
+    for i in range(20):
+        for chat_id in range(3):
+            executor.submit(chat_id, handle, chat_id, i)
+    executor.shutdown()
+
+    assert seen == {chat_id: list(range(20)) for chat_id in range(3)}
+    assert executor.metrics()["pending"] == 0
+
+
+def test_chat_executor_runs_chats_in_parallel():
+    executor = ChatExecutor(max_workers=2, name="test-chat-executor-parallel")
+    slow_started = threading.Event()
+    release = threading.Event()
+    done = threading.Event()
+
+    def slow():
+        slow_started.set()
+        release.wait(1)
+
+    executor.submit(1, slow)
+    slow_started.wait(1)
+    executor.submit(2, done.set)
+    assert done.wait(1)
+    release.set()
+    executor.shutdown()
+
+
+def test_async_chat_executor_keeps_order_per_chat():
+    seen = []
+
+    async def handle(i):
+        await asyncio.sleep(0)
+        seen.append(i)
+
+    async def main():
+        executor = AsyncChatExecutor(max_pending=5, name="test-async-chat-executor")
+        for i in range(10):
+            await executor.submit(1, handle, i)
+        await executor.join()
+        return executor.metrics()
+
+    metrics = asyncio.run(main())
+    assert seen == list(range(10))
+    assert metrics["run"]["calls"] == 10
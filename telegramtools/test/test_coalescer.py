@@ -0,0 +1,100 @@
+import gc
+import time
+import weakref
+
+from ..coalescer import MessageCoalescer, pack_messages
+from ..send_message import _split_message_by_telegram_requirements, send_message
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, kwargs.get("parse_mode")))
+        return text
+
+
+def test_split_prefers_newlines_outside_markdown_entities():
+    message = "*bold\ntext* and\nmore"
+    assert _split_message_by_telegram_requirements(message, "MARKDOWN", max_length=14) == ["*bold\ntext*", "and\nmore"]
+
+
+def test_split_falls_back_to_hard_cut():
+    assert _split_message_by_telegram_requirements("abcdefghij", max_length=4) == ["abcd", "efgh", "ij"]
+
+
+def test_pack_messages():
+    assert pack_messages(["a", "b", "c"], max_length=3) == ["a\nb", "c"]
+    assert pack_messages(["a", "bbbbb"], max_length=3) == ["a", "bbb", "bb"]
+
+
+def test_coalescer_merges_messages_per_chat_and_parse_mode():
+    bot = FakeBot()
+    coalescer = MessageCoalescer(bot, window=60, rate_limiter=None)
+    send_message(bot, 1, "first", coalescer=coalescer)
+    send_message(bot, 1, "second", coalescer=coalescer)
+    send_message(bot, 1, "<b>html</b>", parse_mode="HTML", coalescer=coalescer)
+    send_message(bot, 2, "other", coalescer=coalescer)
+    assert bot.sent == []
+
+    coalescer.close()
+    assert sorted(bot.sent) == [(1, "<b>html</b>", "HTML"), (1, "first\nsecond", "MARKDOWN"), (2, "other", "MARKDOWN")]
+
+
+def test_coalescer_flushes_after_window():
+    bot = FakeBot()
+    coalescer = MessageCoalescer(bot, window=0.01, rate_limiter=None)
+    coalescer.add(1, "hi")
+    coalescer.close(timeout=1)
+    assert bot.sent == [(1, "hi", "MARKDOWN")]
+
+
+def test_direct_message_does_not_overtake_buffered_ones():
+    bot = FakeBot()
+    coalescer = MessageCoalescer(bot, window=60, rate_limiter=None)
+    send_message(bot, 1, "buffered", coalescer=coalescer)
+    send_message(bot, 2, "other chat", coalescer=coalescer)
+    send_message(bot, 1, "with keyboard", reply_markup=object(), coalescer=coalescer, rate_limiter=None)
+    send_message(bot, 1, "direct", rate_limiter=None)
+
+    assert bot.sent == [(1, "buffered", "MARKDOWN"), (1, "with keyboard", "MARKDOWN"), (1, "direct", "MARKDOWN")]
+    coalescer.close()
+    assert bot.sent[-1] == (2, "other chat", "MARKDOWN")
+
+
+class SlowBot(FakeBot):
+    def send_message(self, chat_id, text, **kwargs):
+        time.sleep(0.2)
+        return FakeBot.send_message(self, chat_id, text, **kwargs)
+
+
+def test_direct_message_to_other_chat_does_not_wait_for_coalescer():
+    bot = SlowBot()
+    coalescer = MessageCoalescer(bot, window=0, rate_limiter=None)
+    for chat_id in range(1, 6):
+        coalescer.add(chat_id, "buffered")
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    send_message(FakeBot(), 100, "direct", rate_limiter=None)
+    assert time.monotonic() - start < 0.1
+
+    # waits only for the message to chat 5 being sent or buffered before it
+    send_message(bot, 5, "direct", rate_limiter=None)
+    assert bot.sent.index((5, "buffered", "MARKDOWN")) < bot.sent.index((5, "direct", "MARKDOWN"))
+    coalescer.close()
+
+
+def test_unused_coalescer_is_garbage_collected():
+    coalescer = MessageCoalescer(FakeBot(), window=0, rate_limiter=None)
+    coalescer.add(1, "hi")
+    coalescer.flush()
+    reference = weakref.ref(coalescer)
+    for _ in range(100):
+        if coalescer._thread is None:
+            break
+        time.sleep(0.01)
+    del coalescer
+    gc.collect()
+    assert reference() is None
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from ..command_dispatcher import command_dispatch, parse_command
+
+
+def make_update(text):
+    return SimpleNamespace(message=SimpleNamespace(text=text),
+                           effective_user=SimpleNamespace(full_name="Test User", id=1))
+
+
+def make_dispatcher():
+    @command_dispatch
+    def handle(update, context, **kwargs):
+        return "default"
+
+    @handle.register(["/start", "/begin"])
+    def start(update, context, **kwargs):
+        return "start", kwargs
+
+    @handle.register("/admin", prefix=True)
+    def admin(update, context, **kwargs):
+        return "admin", kwargs
+
+    return handle
+
+
+def test_parse_command():
+    assert parse_command("/reg_ads324@my_bot a b") == ("/reg", "ads324", ["a", "b"], "my_bot")
+    assert parse_command("/start") == ("/start", None, [], None)
+    assert parse_command("") == ("", None, [], None)
+
+
+def test_dispatch_exact_alias_and_prefix():
+    handle = make_dispatcher()
+    assert handle(make_update("/start"), None) == ("start", {})
+    assert handle(make_update("/begin_x1 arg"), None) == ("start", {"args": ["arg"], "target": "x1"})
+    assert handle(make_update("/adminstats"), None) == ("admin", {})
+    assert handle(make_update("/unknown"), None) is None
+
+
+def test_dispatch_bot_mention():
+    handle = make_dispatcher()
+    handle.bot_username = "my_bot"
+    assert handle(make_update("/start@My_Bot"), None) == ("start", {})
+    assert handle(make_update("/start@other_bot"), None) is None
@@ -0,0 +1,62 @@
+import re
+from types import SimpleNamespace
+
+from ..custom_filters import FilterSet, RegexAnywhereFilter
+
+
+def make_filter_set():
+    filters = FilterSet()
+    filters.add("greeting", r"\b(hi|hello)\b", flags=re.IGNORECASE)
+    filters.add("foo", "foo", literal=True)
+    filters.add("foobar", "foobar", literal=True)
+    filters.add("bcd", "bcd", literal=True)
+    filters.add("CaseLess", "BC", literal=True, flags=re.IGNORECASE)
+    filters.add("double", r"(\d)\1")
+    return filters
+
+
+def test_filter_set_reports_overlapping_matches():
+    filters = make_filter_set()
+    assert filters.matches("Hi foobar abcd") == {"greeting", "foo", "foobar", "bcd", "CaseLess"}
+    assert filters.matches("a 11 fOo") == {"double"}
+    assert filters.matches("xyz") == set()
+
+
+def test_filter_set_first_match():
+    filters = make_filter_set()
+    assert filters.first_match("say hi") == "greeting"
+    assert filters.first_match("xyz") is None
+
+
+def test_filter_set_telegram_filter():
+    filters = make_filter_set()
+    message = SimpleNamespace(text="foo")
+    assert filters.filter("foo").filter(message)
+    assert not filters.filter("greeting", "bcd").filter(message)
+    assert filters.filter().filter(message)
+
+
+def test_regex_anywhere_filter():
+    assert RegexAnywhereFilter("b+").filter(SimpleNamespace(text="abbc"))
+    assert not RegexAnywhereFilter("d").filter(SimpleNamespace(text="abbc"))
+
+
+def test_filter_set_ignore_case_beyond_str_lower():
+    filters = FilterSet()
+    filters.add("in", "in", literal=True, flags=re.IGNORECASE)
+    filters.add("st", "st", literal=True, flags=re.IGNORECASE)
+    assert filters.matches("İN ſt") == {"in", "st"}
+    assert filters.matches("İN") == {"in"}
+
+
+def test_filter_set_ignore_case_prefixes_and_equivalent_characters():
+    filters = FilterSet()
+    filters.add("s", "s", literal=True, flags=re.IGNORECASE)
+    filters.add("long s", "ſt", literal=True, flags=re.IGNORECASE)
+    filters.add("st", "st", literal=True, flags=re.IGNORECASE)
+    filters.add("stop", "STOP", literal=True, flags=re.IGNORECASE)
+    filters.add("kelvin", "K", literal=True, flags=re.IGNORECASE)
+    assert filters.matches("ST") == {"s", "long s", "st"}
+    assert filters.matches("ſtop") == {"s", "long s", "st", "stop"}
+    assert filters.matches("k") == {"kelvin"}
+    assert filters.matches("ſ") == {"s"}
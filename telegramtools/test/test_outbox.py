@@ -0,0 +1,103 @@
+from telegram.error import BadRequest
+
+from ..outbox import Outbox
+from ..send_message import send_message
+
+
+class FlakyBot:
+    def __init__(self, failures=0, error=ConnectionError):
+        self.failures = failures
+        self.error = error
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise self.error("boom")
+        self.sent.append((chat_id, text))
+
+
+def make_outbox(bot, tmp_path, **kwargs):
+    return Outbox(bot, str(tmp_path / "outbox.sqlite3"), base_delay=0, rate_limiter=None, **kwargs)
+
+
+def test_outbox_keeps_order_per_chat_and_retries(tmp_path):
+    bot = FlakyBot(failures=1)
+    outbox = make_outbox(bot, tmp_path)
+    outbox.enqueue(1, "first")
+    outbox.enqueue(1, "second")
+    outbox.enqueue(2, "other")
+
+    while outbox.pending():
+        outbox.drain_once()
+
+    assert [text for chat_id, text in bot.sent if chat_id == 1] == ["first", "second"]
+    assert (2, "other") in bot.sent
+
+
+def test_outbox_dedupes_by_idempotency_key(tmp_path):
+    outbox = make_outbox(FlakyBot(), tmp_path)
+    assert outbox.enqueue(1, "hi", idempotency_key="k") is not None
+    assert outbox.enqueue(1, "hi", idempotency_key="k") is None
+    assert outbox.pending() == 1
+
+
+def test_outbox_dead_letters(tmp_path):
+    outbox = make_outbox(FlakyBot(failures=2), tmp_path, max_attempts=2)
+    outbox.enqueue(1, "lost")
+    outbox.drain_once()
+    outbox.drain_once()
+
+    assert outbox.pending() == 0
+    assert [letter["attempts"] for letter in outbox.dead_letters()] == [2]
+
+
+def test_outbox_bad_request_is_dead_at_once(tmp_path):
+    outbox = make_outbox(FlakyBot(failures=1, error=BadRequest), tmp_path)
+    outbox.enqueue(1, "broken")
+    outbox.drain_once()
+
+    assert len(outbox.dead_letters()) == 1
+
+
+def test_send_message_enqueues_to_outbox(tmp_path):
+    bot = FlakyBot()
+    outbox = make_outbox(bot, tmp_path)
+    ids = send_message(bot, 1, "a" * 5000, outbox=outbox, idempotency_key="report")
+
+    assert len(ids) == 2 and not bot.sent
+    assert send_message(bot, 1, "a" * 5000, outbox=outbox, idempotency_key="report") == [None, None]
+
+
+def test_outbox_remembers_sent_idempotency_keys(tmp_path):
+    bot = FlakyBot()
+    outbox = make_outbox(bot, tmp_path)
+    outbox.enqueue(1, "hi", idempotency_key="k")
+    outbox.drain_once()
+    assert outbox.enqueue(1, "hi", idempotency_key="k") is None
+    outbox.drain_once()
+    assert bot.sent == [(1, "hi")]
+
+    outbox.idempotency_ttl = -1
+    assert outbox.enqueue(1, "hi", idempotency_key="k") is not None
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.keys = []
+
+    def acquire(self, chat_id):
+        self.keys.append(chat_id)
+
+
+def test_outbox_uses_same_rate_limiter_key_as_direct_sends(tmp_path):
+    limiter = RecordingLimiter()
+    bot = FlakyBot()
+    outbox = Outbox(bot, str(tmp_path / "outbox.sqlite3"), rate_limiter=limiter)
+    outbox.enqueue(-100123, "group")
+    outbox.enqueue("@channel", "channel")
+    outbox.drain_once()
+    send_message(bot, -100123, "direct", rate_limiter=limiter)
+
+    assert limiter.keys == [-100123, "@channel", -100123]
+    assert bot.sent == [(-100123, "group"), ("@channel", "channel"), (-100123, "direct")]
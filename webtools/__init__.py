@@ -1 +1 @@
-from .blaster_url_tools import change_params_in_url
+from .blaster_url_tools import change_params_in_url, UrlTemplate
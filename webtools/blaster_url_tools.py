@@ -1,4 +1,4 @@
-from urllib.parse import urlsplit, urlunsplit, parse_qs, urlencode
+from urllib.parse import urlsplit, urlunsplit, parse_qs, urlencode, quote_plus, unquote_plus
 
 
 def change_params_in_url(url: str, replace_dict: dict, strict=True):
@@ -28,3 +28,71 @@ def change_params_in_url(url: str, replace_dict: dict, strict=True):
             split_url.fragment,
         ]
     )
+
+
+class UrlTemplate:
+    """
+    Base URL parsed once, for producing many URLs which only differ in a few query params. Unlike
+    change_params_in_url keeps order and encoding of params that are not replaced.
+
+    Usage:
+
+    >>> template = UrlTemplate("https://example.com/stats?ref=nav&start_date=2018-12-24&end_date=2018-12-25")
+    >>> template.render({"start_date": "2018-01-01"})
+    'https://example.com/stats?ref=nav&start_date=2018-01-01&end_date=2018-12-25'
+    >>> dates = daterange("2018-01-01", "2018-12-31")
+    >>> urls = template.render_many({"start_date": d.date(), "end_date": d.date()} for d in dates)
+
+    A list value replaces all occurrences of a multi-valued param, a scalar value leaves a single occurrence.
+
+    :param url: string url
+    :param strict: if True (default) will only replace existing params, if False will add new params to URL
+    """
+
+    def __init__(self, url: str, strict=True):
+        self.url = url
+        self.strict = strict
+        split_url = urlsplit(url)
+        self._prefix = urlunsplit([split_url.scheme, split_url.netloc, split_url.path, "", ""])
+        self._fragment = f"#{split_url.fragment}" if split_url.fragment else ""
+        self._params = split_url.query.split("&") if split_url.query else []
+        self._positions = {}
+        for i, param in enumerate(self._params):
+            key = unquote_plus(param.split("=", 1)[0])
+            self._positions.setdefault(key, []).append(i)
+
+    def render(self, replace_dict: dict):
+        """
+        :param replace_dict: dictionary of keys to replace with new values {param_name: new_value, param_name2: new_value2}
+        :return: string url
+        """
+        params = self._params.copy()
+        added = []
+        for k, v in replace_dict.items():
+            positions = self._positions.get(k)
+            if positions is None:
+                if self.strict:
+                    raise KeyError(f"{k}, set strict to false if you want to add a param to url.")
+                added.append(_encode_param(k, v))
+                continue
+            params[positions[0]] = _encode_param(k, v)
+            for i in positions[1:]:
+                params[i] = None
+        query = "&".join([param for param in params + added if param is not None])
+        return f"{self._prefix}?{query}{self._fragment}" if query else f"{self._prefix}{self._fragment}"
+
+    def render_many(self, replace_dicts):
+        """
+        :param replace_dicts: iterable of replace_dict, see render
+        :return: generator of string urls
+        """
+        for replace_dict in replace_dicts:
+            yield self.render(replace_dict)
+
+
+def _encode_param(key, value):
+    key = quote_plus(str(key))
+    if isinstance(value, (list, tuple)):
+        # Empty list removes the param
+        return "&".join(f"{key}={quote_plus(str(item))}" for item in value) or None
+    return f"{key}={quote_plus(str(value))}"
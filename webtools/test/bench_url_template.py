@@ -0,0 +1,33 @@
+"""
+Compares UrlTemplate.render_many with change_params_in_url. Run from the repository root:
+
+    python -m webtools.test.bench_url_template
+"""
+import timeit
+
+from .. import UrlTemplate, change_params_in_url
+
+URL = "https://www.etsy.com/your/shops/me/stats_page/traffic?ref=seller-platform-mcnav&start_date=2018-12-24&end_date=2018-12-25"
+N = 100000
+
+
+def replace_dicts():
+    for i in range(N):
+        day = f"2018-01-{i % 28 + 1:02d}"
+        yield {"start_date": day, "end_date": day}
+
+
+def bench_change_params_in_url():
+    for replace_dict in replace_dicts():
+        change_params_in_url(URL, replace_dict)
+
+
+def bench_url_template():
+    for _ in UrlTemplate(URL).render_many(replace_dicts()):
+        pass
+
+
+if __name__ == "__main__":
+    for bench in (bench_change_params_in_url, bench_url_template):
+        elapsed = timeit.timeit(bench, number=1)
+        print(f"{bench.__name__}: {elapsed:.3f}s, {elapsed / N * 1e6:.2f}us per url")
@@ -0,0 +1,38 @@
+import pytest
+
+from .. import UrlTemplate, change_params_in_url
+
+url = "https://www.etsy.com/your/shops/me/stats_page/traffic?ref=seller-platform-mcnav&start_date=2018-12-24&end_date=2018-12-25"
+test_result_url = "https://www.etsy.com/your/shops/me/stats_page/traffic?ref=seller-platform-mcnav&start_date=2018-01-01&end_date=2018-01-30"
+
+
+def test_url_template_same_as_change_params_in_url():
+    replace_dict = {"start_date": "2018-01-01", 'end_date': "2018-01-30"}
+    assert UrlTemplate(url).render(replace_dict) == change_params_in_url(url, replace_dict) == test_result_url
+
+
+def test_url_template_strict_keyerror():
+    with pytest.raises(KeyError):
+        UrlTemplate(url).render({"test": "failed"})
+
+
+def test_url_template_not_strict():
+    assert UrlTemplate(url, strict=False).render({"test": "passed"}) == url + "&test=passed"
+
+
+def test_url_template_keeps_order_and_encoding():
+    template = UrlTemplate("https://example.com/a?b=x%2Fy&a=1&empty=&c=z+z#frag")
+    assert template.render({"a": "2 3"}) == "https://example.com/a?b=x%2Fy&a=2+3&empty=&c=z+z#frag"
+
+
+def test_url_template_multi_valued_params():
+    template = UrlTemplate("https://example.com/?id=1&x=0&id=2")
+    assert template.render({"id": ["3", "4"]}) == "https://example.com/?id=3&id=4&x=0"
+    assert template.render({"id": "5"}) == "https://example.com/?id=5&x=0"
+    assert template.render({"id": []}) == "https://example.com/?x=0"
+
+
+def test_url_template_render_many():
+    template = UrlTemplate(url)
+    urls = list(template.render_many({"start_date": day} for day in ("2018-01-01", "2018-01-02")))
+    assert urls == [change_params_in_url(url, {"start_date": day}) for day in ("2018-01-01", "2018-01-02")]